@@ -0,0 +1,108 @@
+"""
+Module tunes the temperature PID automatically with a relay feedback experiment.
+"""
+import math
+
+
+class RelayTuner:
+    """
+    Relay feedback autotuner (Astrom-Hagglund).
+    The output switches between +amplitude and -amplitude each time the feedback crosses the set point (with
+    hysteresis), so the loop oscillates at its ultimate period. The ultimate gain and period of the plant are identified
+    from the oscillation, then converted to PID gains with a tuning rule.
+    Timestamps can be in any unit, Ti and Td are given in the same unit.
+    """
+
+    # Tuning rules as (Kp / Ku, Ti / Pu, Td / Pu).
+    RULES = {'ziegler-nichols': (0.6, 0.5, 0.125),
+             'tyreus-luyben': (1 / 2.2, 2.2, 1 / 6.3)}
+
+    def __init__(self, set_point, amplitude, hysteresis=0.05, cycles=4, timeout=None, rule='tyreus-luyben'):
+        """
+        :param set_point: Value the feedback oscillates around.
+        :param amplitude: Relay output amplitude.
+        :param hysteresis: Error needed to switch the relay, larger than the feedback noise.
+        :param cycles: Number of oscillations measured, after the first one.
+        :param timeout: Maximum duration of the experiment. None for no limit.
+        :param rule: Name of the tuning rule, key of RULES.
+        """
+        self.SetPoint = set_point
+        self.amplitude = amplitude
+        self.hysteresis = hysteresis
+        self.cycles = cycles
+        self.timeout = timeout
+        self.rule = self.RULES[rule]
+
+        # Init experiment.
+        self.start = None
+        self.output = 0
+        self.rising = list()
+        self.amplitudes = list()
+        self.high = -math.inf
+        self.low = math.inf
+
+        # Results.
+        self.done = False
+        self.ku = None
+        self.pu = None
+        self.result = None
+
+    def update(self, feedback_value, timestamp):
+        """
+        Computes the relay output for given feedback and timestamp.
+        Returns 0 once the experiment is done.
+        """
+        if self.done:
+            return 0
+
+        # Compute e(t).
+        error = self.SetPoint - feedback_value
+
+        # First call, start on the side of the error.
+        if self.start is None:
+            self.start = timestamp
+            self.output = self.amplitude if error >= 0 else -self.amplitude
+
+        # Stop if too long.
+        if self.timeout is not None and timestamp - self.start > self.timeout:
+            self.done = True
+            return 0
+
+        # Extremes of the current cycle.
+        self.high = max(self.high, feedback_value)
+        self.low = min(self.low, feedback_value)
+
+        if self.output > 0 and error < -self.hysteresis:
+            # Above set point, cool.
+            self.output = -self.amplitude
+        elif self.output < 0 and error > self.hysteresis:
+            # Below set point, heat. A cycle ends.
+            self.output = self.amplitude
+            if self.rising:
+                self.amplitudes.append((self.high - self.low) / 2)
+            self.rising.append(timestamp)
+            self.high = -math.inf
+            self.low = math.inf
+
+            # First cycle is discarded (transient from the initial state).
+            if len(self.rising) > self.cycles + 1:
+                self.identify()
+                return 0
+
+        return self.output
+
+    def identify(self):
+        """
+        Computes the ultimate gain and period from the last cycles, then the PID gains.
+        """
+        periods = [b - a for a, b in zip(self.rising[1:], self.rising[2:])]
+        amplitude = sum(self.amplitudes[1:]) / len(self.amplitudes[1:])
+
+        # Describing function of a relay with hysteresis.
+        self.ku = 4 * self.amplitude / (math.pi * math.sqrt(max(amplitude ** 2 - self.hysteresis ** 2,
+                                                                (amplitude / 10) ** 2)))
+        self.pu = sum(periods) / len(periods)
+
+        # Gains (Kp, Ti, Td).
+        self.result = (self.rule[0] * self.ku, self.rule[1] * self.pu, self.rule[2] * self.pu)
+        self.done = True
@@ -0,0 +1,389 @@
+"""
+Benchmarks of the station, runnable without hardware (simulated instruments, offscreen Qt platform by default).
+
+    python Benchmark.py pid     Temperature control: loop latency, settling time and overshoot at several rates.
+    python Benchmark.py main    Main tab: latency of each stage with the simulated nVoltmeter, maximum sample rate.
+    python Benchmark.py pidtab  PID tab: latency of each stage, shortest PID period without overruns.
+    python Benchmark.py record  Recording: latency of the writes and maximum row rate of each file format.
+    python Benchmark.py e2e     main, pidtab and record.
+"""
+import argparse
+import os
+import tempfile
+import time
+from unittest import mock
+
+import numpy as np
+from PyQt5 import QtCore, QtWidgets
+
+import Clock
+import Perf
+from Autotune import RelayTuner
+from PID import PID
+from Recorder import RecordWriter, open_sink, h5py
+from SimDAQ import ThermalPlant, SimBackend
+
+
+def percentiles(durations):
+    """Returns the p50 and p99 of durations (s), in ms."""
+    return tuple(np.percentile(np.asarray(durations) * 1e3, (50, 99)))
+
+
+def bench_pid_loop(updates=1000):
+    """
+    Measures the latency of CDAQThread.update (read, PID, write) with the simulated cDAQ.
+
+    :return: (p50, p99) in ms.
+    """
+    from TempControl import CDAQThread
+
+    # Start worker without thread, the loop timer never fires without event loop.
+    worker = CDAQThread(backend=SimBackend())
+    worker.start()
+    worker.loop.stop()
+    worker.set_point(25)
+    worker.set_kp(20)
+    worker.set_ti(5)
+    worker.set_td(1)
+    worker.set_max(50)
+    worker.toogle_pid(True)
+
+    durations = list()
+    for _ in range(updates):
+        start = time.perf_counter()
+        worker.update()
+        durations.append(time.perf_counter() - start)
+    worker.stop()
+
+    return percentiles(durations)
+
+
+def tune_plant(set_point=25.0, amplitude=50, rate=1):
+    """
+    Runs the relay autotuning on the simulated plant, as the Autotune button does.
+
+    :return: (Kp, Ti, Td), Ti and Td in s as in the GUI.
+    """
+    plant = ThermalPlant(noise=0.002)
+    tuner = RelayTuner(set_point, amplitude, hysteresis=0.02, timeout=2 * 3600 * 1000)
+
+    # Timestamps in ms as in CDAQThread.
+    k = 0
+    while not tuner.done:
+        plant.step(tuner.update(plant.measure(), k / rate * 1000), 1 / rate)
+        k += 1
+
+    kp, ti, td = tuner.result
+    return kp, ti / 1000, td / 1000
+
+
+def bench_pid_step(rate, set_point=25.0, gains=(20, 5, 1), maximum=50, duration=1800, band=0.05):
+    """
+    Simulates a set point step from ambient with the PID updated at a given rate (simulated time).
+
+    :param rate: PID update rate (Hz).
+    :param gains: (Kp, Ti, Td), Ti and Td in s as in the GUI.
+    :param band: Settling band around the set point (°C).
+    :return: (settling time (s), overshoot (°C), steady state standard deviation (°C)).
+    """
+    plant = ThermalPlant(noise=0.002)
+    pid = PID(timestamp=0, k_p=gains[0], t_i=gains[1] * 1000, t_d=gains[2] * 1000, maximum=maximum,
+              set_point=set_point)
+
+    # Run loop, timestamps in ms as in CDAQThread.
+    dt = 1 / rate
+    steps = int(duration * rate)
+    temperatures = np.empty(steps)
+    for k in range(steps):
+        temperatures[k] = plant.measure()
+        plant.step(pid.update(temperatures[k], k * dt * 1000), dt)
+
+    # Last time out of the band.
+    outside = np.flatnonzero(np.abs(temperatures - set_point) > band)
+    settling = (outside[-1] + 1) * dt if len(outside) else 0.0
+    if settling >= duration:
+        settling = np.nan
+
+    overshoot = max(temperatures.max() - set_point, 0)
+    steady = temperatures[-steps // 10:].std()
+    return settling, overshoot, steady
+
+
+def bench_pid(rates=(0.5, 1, 2, 5, 10)):
+    print('PID loop latency (simulated cDAQ)')
+    print('  p50 {:.3f} ms, p99 {:.3f} ms'.format(*bench_pid_loop()))
+    print()
+
+    # Default gains of the GUI, then the gains found by the autotuning.
+    for name, gains in (('default gains', (20, 5, 1)), ('autotuned gains', tune_plant())):
+        print('Step 22 -> 25 °C, {} (Kp {:.3g}, Ti {:.3g} s, Td {:.3g} s)'.format(name, *gains))
+        print('  {:>8} {:>12} {:>14} {:>12}'.format('rate Hz', 'settling s', 'overshoot °C', 'noise °C'))
+        for rate in rates:
+            print('  {:>8g} {:>12.1f} {:>14.3f} {:>12.4f}'.format(rate, *bench_pid_step(rate, gains=gains)))
+        print()
+
+
+def run_for(duration):
+    """Runs the Qt event loop for a duration (s)."""
+    loop = QtCore.QEventLoop()
+    QtCore.QTimer.singleShot(int(duration * 1000), loop.quit)
+    loop.exec_()
+
+
+def print_stages(names):
+    """Prints the number of calls, p50 and p99 of the stages."""
+    print('  {:<20} {:>8} {:>10} {:>10}'.format('stage', 'calls', 'p50 ms', 'p99 ms'))
+    for name in names:
+        stage = Perf.stage(name)
+        print('  {:<20} {:>8} {:>10.3f} {:>10.3f}'.format(name, stage.count, *stage.percentiles()))
+
+
+def busy(names, duration):
+    """Returns the fraction of the duration spent in the stages."""
+    return sum(Perf.stage(name).total for name in names) / duration
+
+
+def start_recording(main, filename):
+    """Starts the recording of the main tab to a file, without the file dialog."""
+    with mock.patch.object(QtWidgets.QFileDialog, 'getSaveFileName', return_value=(filename, '')):
+        main.record()
+
+
+def stop_recording(main):
+    """Stops the recording of the main tab and waits for the files to be closed."""
+    main.record()
+    for writer in list(RecordWriter.closing):
+        writer.wait()
+
+
+def stop_worker(worker, thread):
+    """Stops a worker (stop slot, finished signal) in its thread and waits for the thread to finish."""
+    # The thread is quit from this thread, run the event loop meanwhile.
+    loop = QtCore.QEventLoop()
+    thread.finished.connect(loop.quit)
+    QtCore.QMetaObject.invokeMethod(worker, 'stop', QtCore.Qt.QueuedConnection)
+    loop.exec_()
+    thread.wait()
+
+
+def bench_main(duration=5.0, rates=(1e3, 1e4, 1e5, 3e5, 1e6), buffer=0, data_format='SREAL', srq=False,
+               directory=None):
+    """
+    Runs the main tab with the simulated instruments at the fastest conversion rate while recording, and prints the
+    latency of each stage. Then feeds synthetic readings at increasing rates and prints the load of the GUI thread.
+    A rate is sustainable if the GUI thread is busy less than half the time, the graph keeps its frame rate and the
+    recording keeps up. The maximum sustainable rate is the last one before the first rate failing.
+
+    :param duration: Duration of each run (s).
+    :param rates: Synthetic sample rates (Hz).
+    :param buffer: Buffer size of the buffered acquisition, 0 to read one reading at a time.
+    :param data_format: Data format of the readings, key of Nanovolt.DATA_FORMATS.
+    :param srq: Read on service request instead of polling.
+    :param directory: Directory of the recorded files. Temporary if None.
+    """
+    from Microcal import WidgetMain
+    from Nanovolt import DialogNanovolt
+
+    directory = directory or tempfile.mkdtemp()
+    main = WidgetMain(simulate=True)
+    main.tab.show()
+
+    # Fastest conversions, no filter, as set from the configuration dialog.
+    main.wid_nvolt.connect()
+    main.wid_nvolt.set_format(data_format)
+    dialog = DialogNanovolt(main.wid_nvolt)
+    dialog.spin_rate.setValue(0.01)
+    dialog.group_digital.setChecked(False)
+    dialog.group_buffer.setChecked(buffer > 0)
+    dialog.spin_buffer.setValue(buffer)
+    dialog.check_srq.setChecked(srq)
+    dialog.send_config()
+
+    # Acquire and record.
+    Perf.clear()
+    start_recording(main, os.path.join(directory, 'bench_main.csv'))
+    main.aquire()
+    run_for(duration)
+    main.aquire()
+    # Stopped once the last readings of the sampler are received.
+    while main.Aquire_Status:
+        run_for(0.01)
+    stop_recording(main)
+
+    print('Main tab, simulated nVoltmeter (NPLC 0.01, {}, {}, {})'.format(
+        'buffer of {} readings'.format(buffer) if buffer else 'one reading at a time', data_format,
+        'service requests' if srq else 'polled'))
+    print('  {:.0f} readings/s'.format(len(main.data) / duration))
+    print_stages(('nvolt.srq', 'nvolt.query', 'nvolt.buffer', 'nvolt.display', 'main.update_graph', 'main.render', 'plot.decimate', 'plot.blit',
+                  'plot.layout', 'plot.draw', 'record.write'))
+    print()
+
+    # Synthetic readings, sent in batches as by the sampler thread.
+    # Frame rate of the graph, kept at the cap (within 10 %) at a sustainable rate.
+    cap = 1000 / main.scheduler.timer.interval()
+    print('Main tab, synthetic readings while recording (GUI thread load, sustainable if < 50 % at {:g} fps)'.format(
+        cap))
+    print('  {:>10} {:>8} {:>8} {:>16} {:>12} {:>8}'.format('rate Hz', 'load %', 'fps', 'update p99 ms',
+                                                         'render p99 ms', 'queue'))
+    sustainable = previous = 0
+    # First rate run once more first, not counted: the axes are rescaled to the synthetic readings.
+    for warmup, rate in [(True, rates[0])] + [(False, rate) for rate in rates]:
+        Perf.clear()
+        main.clear_chart()
+        start_recording(main, os.path.join(directory, 'bench_rate.csv'))
+        main.Aquire_Status = True
+        start = Clock.now()
+        produced = 0
+
+        def produce():
+            nonlocal produced
+            # Readings due since the start, on the clock of the acquisition.
+            now = Clock.now()
+            count = int(rate * (now - start)) - produced
+            if count > 0:
+                times = now - np.arange(count - 1, -1, -1) / rate
+                main.update_graph(times, np.random.normal(1e-6, 20e-9, count))
+                produced += count
+
+        timer = QtCore.QTimer()
+        timer.timeout.connect(produce)
+        timer.start(int(main.wid_nvolt.worker.BATCH_INTERVAL * 1000))
+        run_for(duration)
+        timer.stop()
+        elapsed = Clock.now() - start
+
+        # Pending blocks of the recording, before it is flushed by stop.
+        queue = main.writer.queue.qsize()
+        main.Aquire_Status = False
+        stop_recording(main)
+        if warmup:
+            continue
+
+        load = busy(('main.update_graph', 'main.render'), elapsed)
+        fps = Perf.stage('main.render').count / elapsed
+        print('  {:>10g} {:>8.1f} {:>8.1f} {:>16.3f} {:>12.3f} {:>8}'.format(
+            rate, load * 100, fps, Perf.stage('main.update_graph').percentiles()[1],
+            Perf.stage('main.render').percentiles()[1], queue))
+        # Up to the first rate failing.
+        if load < 0.5 and queue < 10 and fps >= 0.9 * cap and sustainable == previous:
+            sustainable = rate
+        previous = rate
+    print('  Maximum sustainable rate: {:g} Hz'.format(sustainable))
+    print()
+
+    # Stop the threads before the widgets are deleted.
+    stop_worker(main.wid_nvolt.worker, main.wid_nvolt.thread)
+    stop_worker(main.wid_pid.worker, main.wid_pid.thread)
+    stop_worker(main.wid_pump.protocol, main.wid_pump.thread)
+
+
+def bench_pidtab(duration=5.0, periods=(1000, 100, 20, 10, 5, 2, 1)):
+    """
+    Runs the PID tab with the simulated cDAQ at decreasing PID periods, and prints the achieved update rate, the
+    overruns and the latency of each stage.
+
+    :param duration: Duration of each run (s).
+    :param periods: PID periods (ms).
+    """
+    from TempControl import WidgetPID
+
+    wid = WidgetPID(backend=SimBackend())
+    wid.show()
+    wid.start()
+
+    # Loop statistics, sent by the worker thread.
+    stats = [0, 0]
+
+    def update_stats(ticks, overruns):
+        stats[:] = [ticks, overruns]
+    wid.worker.stats.connect(update_stats)
+
+    print('PID tab, simulated cDAQ')
+    print('  {:>10} {:>12} {:>12} {:>16} {:>16} {:>16}'.format('period ms', 'updates/s', 'overruns %', 'update p99 ms',
+                                                             'updated p99 ms', 'render p99 ms'))
+    shortest = previous = None
+    for period in periods:
+        wid.worker.set_period(period)
+        # Skip the first period, started with the previous one.
+        run_for(max(period / 1000, 0.1))
+        Perf.clear()
+        ticks, overruns = stats
+        elapsed = max(duration, 3 * period / 1000)
+        run_for(elapsed)
+        ticks, overruns = stats[0] - ticks, stats[1] - overruns
+
+        missed = overruns / max(ticks + overruns, 1)
+        print('  {:>10g} {:>12.1f} {:>12.2f} {:>16.3f} {:>16.3f} {:>16.3f}'.format(
+            period, ticks / elapsed, missed * 100, Perf.stage('pid.update').percentiles()[1],
+            Perf.stage('pid.updated').percentiles()[1], Perf.stage('pid.render').percentiles()[1]))
+        if missed < 0.01 and shortest in (None, previous):
+            shortest = period
+        previous = period
+    print('  Shortest period without overruns (< 1 %): {} ms'.format(shortest))
+    print()
+
+    wid.start()
+    wid.worker.stats.disconnect(update_stats)
+    stop_worker(wid.worker, wid.thread)
+
+
+def bench_record(rows=200000, columns=6, block=100, directory=None):
+    """
+    Records rows as fast as possible in each file format, and prints the latency of the writes and the row rate.
+
+    :param rows: Number of rows recorded.
+    :param columns: Number of columns (time, nVolt and cDAQ values).
+    :param block: Rows per block, as sent by the acquisition.
+    :param directory: Directory of the recorded files. Temporary if None.
+    """
+    directory = directory or tempfile.mkdtemp()
+    data = np.random.normal(size=(rows, columns))
+    names = ['Column {}'.format(i) for i in range(columns)]
+
+    print('Recording, {} rows of {} columns in blocks of {}'.format(rows, columns, block))
+    print('  {:<6} {:>12} {:>14} {:>14} {:>10}'.format('format', 'rows/s', 'write p50 ms', 'write p99 ms', 'MB'))
+    for ext in ('.csv', '.h5', '.npy'):
+        if ext == '.h5' and h5py is None:
+            continue
+        filename = os.path.join(directory, 'bench_record' + ext)
+        Perf.clear()
+
+        # Queue all the rows, then wait for the writer.
+        start = time.perf_counter()
+        writer = RecordWriter(open_sink(filename))
+        writer.start()
+        writer.header(names, ['V'] * columns)
+        for i in range(0, rows, block):
+            writer.write(data[i:i + block])
+        writer.stop()
+        elapsed = time.perf_counter() - start
+
+        print('  {:<6} {:>12.0f} {:>14.3f} {:>14.3f} {:>10.1f}'.format(
+            ext, rows / elapsed, *Perf.stage('record.write').percentiles(), os.path.getsize(filename) / 1e6))
+    print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmarks of the station, without hardware.')
+    parser.add_argument('bench', choices=('pid', 'main', 'pidtab', 'record', 'e2e'))
+    parser.add_argument('--duration', type=float, default=5.0, help='Duration of each run (s).')
+    parser.add_argument('--buffer', type=int, default=0,
+                        help='Buffer size of the nVoltmeter buffered acquisition (main), 0 for one reading at a time.')
+    parser.add_argument('--format', default='SREAL', choices=('ASCII', 'SREAL', 'DREAL'),
+                        help='Data format of the nVoltmeter readings (main).')
+    parser.add_argument('--srq', action='store_true', help='Read the nVoltmeter on service request (main).')
+    args = parser.parse_args()
+
+    # Headless, unless a platform is given.
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    # Widgets and workers need an application.
+    app = QtWidgets.QApplication([])
+
+    if args.bench == 'pid':
+        bench_pid()
+    if args.bench in ('main', 'e2e'):
+        bench_main(args.duration, buffer=args.buffer, data_format=args.format, srq=args.srq)
+    if args.bench in ('pidtab', 'e2e'):
+        bench_pidtab(args.duration)
+    if args.bench in ('record', 'e2e'):
+        bench_record()
@@ -0,0 +1,27 @@
+"""
+Module gives the time shared by the acquisition threads (nVoltmeter sampler, cDAQ, pump), so their timestamps and the
+markers of the recording (injections, current pulses) can be aligned within microseconds.
+The clock is monotonic and high resolution (time.perf_counter_ns), offset at import to the wall clock: times are in
+seconds since the epoch, as time.time(), but never jump when the system time is adjusted.
+"""
+import time
+
+try:
+    perf_counter_ns = time.perf_counter_ns
+except AttributeError:
+    # Python < 3.7.
+    def perf_counter_ns():
+        return int(time.perf_counter() * 1e9)
+
+# Offset of the clock to the epoch (ns), set once.
+_OFFSET_NS = int(time.time() * 1e9) - perf_counter_ns()
+
+
+def now_ns():
+    """Returns the time in ns since the epoch (int)."""
+    return perf_counter_ns() + _OFFSET_NS
+
+
+def now():
+    """Returns the time in s since the epoch (float, resolution better than 1 µs)."""
+    return now_ns() * 1e-9
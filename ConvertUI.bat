@@ -6,4 +6,5 @@ pyuic5 -x DialogNanovolt.ui > DialogNanovolt.py
 
 pyuic5 -x WidgetPID.ui > WidgetPID.py
 pyuic5 -x WidgetMain.ui > WidgetMain.py
+pyuic5 -x WidgetDiagnostics.ui > WidgetDiagnostics.py
 pause
\ No newline at end of file
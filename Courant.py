@@ -1,5 +1,4 @@
 import numpy as np
-import visa
 from PyQt5 import QtCore, QtWidgets, QtGui
 
 
@@ -13,8 +12,9 @@ class WidgetCourant(QtWidgets.QWidget, Ui_WidgetCourant):
         self.setupUi(self)
         self.rm = res_man
 
-        # Init variable.
+        # Init variable. Program of the current source: rows of (voltage limit, current (A), dwell (s)).
         self.courant = None
+        self.program = None
 
         # List ports and filter for GPIB devices only.
         self.combo_port.addItems(filter(lambda k: 'GPIB' in k, self.rm.list_resources()))
@@ -62,13 +62,27 @@ class WidgetCourant(QtWidgets.QWidget, Ui_WidgetCourant):
             self.connect_status.setPixmap(QtGui.QPixmap(".\\ico\\WX_circle_green.png"))
 
     def config(self):
-        data_config = np.loadtxt("%s" % self.line_config.text(), skiprows = 1)
+        data_config = np.loadtxt("%s" % self.line_config.text(), skiprows = 1, ndmin = 2)
         print(data_config)
         index = 1
         self.courant.clear()
         for data_set in data_config:
             self.courant.write("B%fL%fV%dI%fW%dX" %(index, index, data_set[0], data_set[1], data_set[2]))
             index += 1
+        # Kept to mark the current steps in the recording.
+        self.program = data_config
+
+    def pulses(self, start):
+        """
+        Returns the steps of the program run from start, as rows of (time, step (from 1), current (A)). The times of
+        the steps follow from their dwell times.
+
+        :param start: Time the program was started (Clock).
+        """
+        if self.program is None:
+            return []
+        starts = start + np.concatenate(([0], np.cumsum(self.program[:-1, 2])))
+        return [(t, i + 1, current) for i, (t, current) in enumerate(zip(starts, self.program[:, 1]))]
 
     def browse(self):
         self.line_config.setText(QtWidgets.QFileDialog.getOpenFileName()[0])
@@ -77,12 +91,13 @@ class WidgetCourant(QtWidgets.QWidget, Ui_WidgetCourant):
 
 if __name__ == "__main__":
     import sys
+    from Drivers import resource_manager
 
     # Define app
     app = QtWidgets.QApplication(sys.argv)
 
-    # Create widget.
-    wid = WidgetCourant(visa.ResourceManager())
+    # Create widget. Simulated instruments with --simulate.
+    wid = WidgetCourant(resource_manager('--simulate' in sys.argv))
 
     # Show window.
     wid.show()
@@ -0,0 +1,146 @@
+"""
+Module shows the performance of the acquisition: latency of each stage of the hot path, gauges (missed PID ticks,
+recording queues) and the histogram of the selected stage. Optionally logs them to a CSV file every refresh.
+Can be executed as standalone or imported to be used as a widget.
+"""
+import time
+
+import matplotlib.pyplot as plt
+import numpy as np
+from PyQt5 import QtCore, QtWidgets
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+
+import Perf
+from WidgetDiagnostics import Ui_WidgetDiagnostics
+
+
+class WidgetDiagnostics(QtWidgets.QWidget, Ui_WidgetDiagnostics):
+    """
+    Diagnostics tab. Refreshed by a timer, only while visible, except for the log file.
+    The calls/s of the render stages are the redraw rates (fps) of the graphs.
+    """
+
+    def __init__(self, interval=1000):
+        """
+        :param interval: Refresh period (ms).
+        """
+        # Initialise overloaded classes.
+        super().__init__()
+        self.setupUi(self)
+
+        # Create histogram figure.
+        self.figure, self.ax = plt.subplots()
+        self.canvas = FigureCanvas(self.figure)
+        self.layout_graph.addWidget(self.canvas)
+
+        # Init log file (opened while logging) and counts at last refresh.
+        self.log = None
+        self.counts = dict()
+        self.last = time.perf_counter()
+
+        # Connect slots.
+        self.check_log.toggled.connect(self.toggle_log)
+        self.btn_browse.clicked.connect(self.browse)
+        self.table_stages.itemSelectionChanged.connect(self.draw_histogram)
+
+        # Start refresh timer.
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(interval)
+
+    @QtCore.pyqtSlot()
+    def refresh(self):
+        # Calls since last refresh.
+        now = time.perf_counter()
+        elapsed = now - self.last
+        self.last = now
+        rows = list()
+        for name, stage in list(Perf.STAGES.items()):
+            count = stage.count
+            rate = (count - self.counts.get(name, count)) / elapsed
+            self.counts[name] = count
+            rows.append((name, rate) + stage.percentiles() + (stage.maximum(),))
+        gauges = list(Perf.GAUGES.items())
+
+        if self.log is not None:
+            self.write_log(rows, gauges)
+
+        # Update tables and histogram if shown.
+        if self.isVisible():
+            self.table_stages.setRowCount(len(rows))
+            for i, row in enumerate(rows):
+                self.table_stages.setItem(i, 0, QtWidgets.QTableWidgetItem(row[0]))
+                for j, value in enumerate(row[1:]):
+                    self.table_stages.setItem(i, j + 1, QtWidgets.QTableWidgetItem('{:0.3f}'.format(value)))
+
+            self.table_gauges.setRowCount(len(gauges))
+            for i, (name, value) in enumerate(gauges):
+                self.table_gauges.setItem(i, 0, QtWidgets.QTableWidgetItem(name))
+                self.table_gauges.setItem(i, 1, QtWidgets.QTableWidgetItem(str(value)))
+
+            self.draw_histogram()
+
+    @QtCore.pyqtSlot()
+    def draw_histogram(self):
+        """
+        Draws the histogram of the durations of the selected stage.
+        """
+        self.ax.clear()
+        items = self.table_stages.selectedItems()
+        if items:
+            name = self.table_stages.item(items[0].row(), 0).text()
+            counts, edges = Perf.stage(name).histogram()
+            self.ax.bar(edges[:-1] * 1e3, counts, width=np.diff(edges) * 1e3, align='edge')
+            self.ax.set_xscale('log')
+            self.ax.set(title=name, xlabel='Duration (ms)', ylabel='Calls')
+        self.canvas.draw()
+
+    def write_log(self, rows, gauges):
+        # One line per stage and gauge, with the time of the refresh.
+        now = time.time()
+        for row in rows:
+            self.log.write('{},{},{:f},{:f},{:f},{:f}\n'.format(now, *row))
+        for name, value in gauges:
+            self.log.write('{},{},{}\n'.format(now, name, value))
+        self.log.flush()
+
+    @QtCore.pyqtSlot(bool)
+    def toggle_log(self, checked):
+        if checked:
+            try:
+                # Append to the file, header if new.
+                self.log = open(self.line_log.text(), mode='a+t')
+                if self.log.tell() == 0:
+                    self.log.write('Time,Stage,Calls/s,p50 (ms),p99 (ms),Max (ms)\n')
+            except IOError as e:
+                QtWidgets.QMessageBox.critical(self, 'Error', e.strerror)
+                self.check_log.setChecked(False)
+                return
+        elif self.log is not None:
+            self.log.close()
+            self.log = None
+        self.line_log.setEnabled(not checked)
+        self.btn_browse.setEnabled(not checked)
+
+    @QtCore.pyqtSlot()
+    def browse(self):
+        filename = QtWidgets.QFileDialog.getSaveFileName(self, 'Log file', self.line_log.text(),
+                                                         'CSV files (*.csv)')[0]
+        if filename != '':
+            self.line_log.setText(filename)
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Define app.
+    app = QtWidgets.QApplication(sys.argv)
+
+    # Create diagnostics widget.
+    wid = WidgetDiagnostics()
+
+    # Show window.
+    wid.show()
+
+    # Run GUI loop.
+    sys.exit(app.exec_())
@@ -67,7 +67,7 @@ class Ui_DialogNanovolt(object):
         self.buttonBox.setStandardButtons(QtWidgets.QDialogButtonBox.Cancel|QtWidgets.QDialogButtonBox.Ok)
         self.buttonBox.setCenterButtons(False)
         self.buttonBox.setObjectName("buttonBox")
-        self.gridLayout.addWidget(self.buttonBox, 11, 0, 1, 1)
+        self.gridLayout.addWidget(self.buttonBox, 14, 0, 1, 1)
         self.group_digital = QtWidgets.QGroupBox(DialogNanovolt)
         self.group_digital.setCheckable(True)
         self.group_digital.setChecked(False)
@@ -94,8 +94,45 @@ class Ui_DialogNanovolt(object):
         self.radio_moving.setObjectName("radio_moving")
         self.gridLayout_2.addWidget(self.radio_moving, 1, 0, 1, 1)
         self.gridLayout.addWidget(self.group_digital, 9, 0, 1, 1)
+        self.group_buffer = QtWidgets.QGroupBox(DialogNanovolt)
+        self.group_buffer.setCheckable(True)
+        self.group_buffer.setChecked(False)
+        self.group_buffer.setObjectName("group_buffer")
+        self.gridLayout_3 = QtWidgets.QGridLayout(self.group_buffer)
+        self.gridLayout_3.setObjectName("gridLayout_3")
+        self._label_7 = QtWidgets.QLabel(self.group_buffer)
+        self._label_7.setObjectName("_label_7")
+        self.gridLayout_3.addWidget(self._label_7, 0, 0, 1, 1)
+        self.spin_buffer = QtWidgets.QSpinBox(self.group_buffer)
+        self.spin_buffer.setMinimum(2)
+        self.spin_buffer.setMaximum(1024)
+        self.spin_buffer.setProperty("value", 100)
+        self.spin_buffer.setObjectName("spin_buffer")
+        self.gridLayout_3.addWidget(self.spin_buffer, 0, 1, 1, 1)
+        self.gridLayout.addWidget(self.group_buffer, 10, 0, 1, 1)
+        self.check_srq = QtWidgets.QCheckBox(DialogNanovolt)
+        self.check_srq.setObjectName("check_srq")
+        self.gridLayout.addWidget(self.check_srq, 11, 0, 1, 1)
+        self.group_memory = QtWidgets.QGroupBox(DialogNanovolt)
+        self.group_memory.setObjectName("group_memory")
+        self.gridLayout_4 = QtWidgets.QGridLayout(self.group_memory)
+        self.gridLayout_4.setObjectName("gridLayout_4")
+        self._label_8 = QtWidgets.QLabel(self.group_memory)
+        self._label_8.setObjectName("_label_8")
+        self.gridLayout_4.addWidget(self._label_8, 0, 0, 1, 1)
+        self.spin_slot = QtWidgets.QSpinBox(self.group_memory)
+        self.spin_slot.setMaximum(4)
+        self.spin_slot.setObjectName("spin_slot")
+        self.gridLayout_4.addWidget(self.spin_slot, 0, 1, 1, 1)
+        self.btn_save = QtWidgets.QPushButton(self.group_memory)
+        self.btn_save.setObjectName("btn_save")
+        self.gridLayout_4.addWidget(self.btn_save, 0, 2, 1, 1)
+        self.btn_recall = QtWidgets.QPushButton(self.group_memory)
+        self.btn_recall.setObjectName("btn_recall")
+        self.gridLayout_4.addWidget(self.btn_recall, 0, 3, 1, 1)
+        self.gridLayout.addWidget(self.group_memory, 12, 0, 1, 1)
         spacerItem = QtWidgets.QSpacerItem(20, 110, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
-        self.gridLayout.addItem(spacerItem, 10, 0, 1, 1)
+        self.gridLayout.addItem(spacerItem, 13, 0, 1, 1)
 
         self.retranslateUi(DialogNanovolt)
         self.buttonBox.accepted.connect(DialogNanovolt.accept)
@@ -109,6 +146,12 @@ class Ui_DialogNanovolt(object):
         DialogNanovolt.setTabOrder(self.radio_moving, self.radio_repeating)
         DialogNanovolt.setTabOrder(self.radio_repeating, self.spin_filter)
         DialogNanovolt.setTabOrder(self.spin_filter, self.group_digital)
+        DialogNanovolt.setTabOrder(self.group_digital, self.group_buffer)
+        DialogNanovolt.setTabOrder(self.group_buffer, self.spin_buffer)
+        DialogNanovolt.setTabOrder(self.spin_buffer, self.check_srq)
+        DialogNanovolt.setTabOrder(self.check_srq, self.spin_slot)
+        DialogNanovolt.setTabOrder(self.spin_slot, self.btn_save)
+        DialogNanovolt.setTabOrder(self.btn_save, self.btn_recall)
 
     def retranslateUi(self, DialogNanovolt):
         _translate = QtCore.QCoreApplication.translate
@@ -126,6 +169,17 @@ class Ui_DialogNanovolt(object):
         self._label_6.setText(_translate("DialogNanovolt", "Filter count"))
         self.radio_repeating.setText(_translate("DialogNanovolt", "Repeating"))
         self.radio_moving.setText(_translate("DialogNanovolt", "Moving"))
+        self.group_buffer.setTitle(_translate("DialogNanovolt", "Buffered acquisition"))
+        self._label_7.setText(_translate("DialogNanovolt", "Buffer size"))
+        self.spin_buffer.setSuffix(_translate("DialogNanovolt", " readings"))
+        self.check_srq.setToolTip(_translate("DialogNanovolt", "Wait for the instrument to request service when a reading (or the buffer) is ready, instead of polling it."))
+        self.check_srq.setText(_translate("DialogNanovolt", "Read on service request"))
+        self.group_memory.setTitle(_translate("DialogNanovolt", "Instrument memory"))
+        self._label_8.setText(_translate("DialogNanovolt", "Slot"))
+        self.btn_save.setToolTip(_translate("DialogNanovolt", "Send the configuration and save it in the slot (*SAV)."))
+        self.btn_save.setText(_translate("DialogNanovolt", "Save"))
+        self.btn_recall.setToolTip(_translate("DialogNanovolt", "Recall the configuration saved in the slot (*RCL)."))
+        self.btn_recall.setText(_translate("DialogNanovolt", "Recall"))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,61 @@
+"""
+Module opens the interfaces of the instruments: the GPIB bus (VISA), the serial port of the pump and the cDAQ.
+Each interface has a hardware backend and a simulated one (SimInstruments, SimDAQ), so the whole station can run
+without hardware (--simulate).
+"""
+import serial
+from serial.tools import list_ports
+
+
+class SerialBackend:
+    """
+    Serial ports of the computer, opened with pyserial.
+    """
+
+    def ports(self):
+        """Returns the names of the available ports."""
+        return [port.device for port in list_ports.comports()]
+
+    def serial(self):
+        """Returns a new serial port (not opened) with the settings of the pump."""
+        return serial.Serial(parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_TWO)
+
+
+def resource_manager(simulate=False):
+    """
+    Returns the VISA resource manager of the GPIB instruments.
+
+    :param simulate: Simulated nanovoltmeter and current source if True.
+    """
+    if simulate:
+        from SimInstruments import SimResourceManager
+        return SimResourceManager()
+
+    import pyvisa
+    return pyvisa.ResourceManager()
+
+
+def serial_backend(simulate=False):
+    """
+    Returns the serial backend of the pump.
+
+    :param simulate: Simulated PHD2000 if True.
+    """
+    if simulate:
+        from SimInstruments import SimSerialBackend
+        return SimSerialBackend()
+
+    return SerialBackend()
+
+
+def daq_backend(simulate=False):
+    """
+    Returns the cDAQ backend of the temperature control, None for the NI-MAX tasks.
+
+    :param simulate: Simulated cDAQ and Peltier stage if True.
+    """
+    if simulate:
+        from SimDAQ import SimBackend
+        return SimBackend()
+
+    return None
@@ -1,29 +1,52 @@
 import matplotlib.pyplot as plt
 
-import time
-import visa
+import os
+import numpy as np
 from PyQt5 import QtCore, QtWidgets, QtGui
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
 
+import Clock
+import Perf
 import WidgetMain
 from TempControl import WidgetPID
 from Nanovolt import WidgetNanovolt
 from Pump import WidgetPump
 from Courant import WidgetCourant
+from Diagnostics import WidgetDiagnostics
+from Drivers import resource_manager, serial_backend, daq_backend
+from RingBuffer import RingBuffer
+from Plot import BlitPlot, RenderScheduler
+from Recorder import RecordWriter, open_sink, FILE_FILTER
 
 
 class WidgetMain(QtWidgets.QWidget, WidgetMain.Ui_Form):
-    def __init__(self):
+    # Number of readings kept in memory for the graph. Older ones are spilled to disk.
+    CAPACITY = 500000
+    # Sample clock rate (Hz) of the hardware-timed cDAQ acquisition. None to read the cDAQ at each PID update.
+    DAQ_RATE = None
+
+    def __init__(self, simulate=False, daq_rate=DAQ_RATE):
+        """
+        :param simulate: Run with simulated instruments, pump and cDAQ (see Drivers).
+        :param daq_rate: Sample clock rate (Hz) of the hardware-timed cDAQ acquisition, None for software-timed.
+        """
         # Initialise overloaded classes.
         super().__init__()
         self.setupUi(self)
 
+        # Create render scheduler shared by the tabs.
+        self.scheduler = RenderScheduler()
+
+        # Open interfaces. GPIB instruments share the resource manager.
+        res_man = resource_manager(simulate)
+
         # Create widgets
-        self.wid_pump = WidgetPump()
-        self.wid_nvolt = WidgetNanovolt(visa.ResourceManager(), self.btn_Aquire)
-        self.wid_pid = WidgetPID() # ouvre la premiere fenetre
-        self.wid_courant= WidgetCourant(visa.ResourceManager())
+        self.wid_pump = WidgetPump(serial_backend(simulate))
+        self.wid_nvolt = WidgetNanovolt(res_man, self.btn_Aquire)
+        self.wid_pid = WidgetPID(self.scheduler, daq_rate, backend=daq_backend(simulate)) # ouvre la premiere fenetre
+        self.wid_courant= WidgetCourant(res_man)
+        self.wid_diag = WidgetDiagnostics()
 
         # Add widgets to main.
         self.group_pump.setLayout(self.wid_pump.layout())
@@ -35,6 +58,7 @@ class WidgetMain(QtWidgets.QWidget, WidgetMain.Ui_Form):
         # Add widgets to tab.
         self.tab.addTab(self, 'Main tab')
         self.tab.addTab(self.wid_pid, 'PID')
+        self.tab.addTab(self.wid_diag, 'Diagnostics')
 
         ''' Figure '''
         # Create figure to display temperature.
@@ -47,10 +71,8 @@ class WidgetMain(QtWidgets.QWidget, WidgetMain.Ui_Form):
         self.layout_graph.insertWidget(0, self.toolbar)
         self.layout_graph.insertWidget(1, self.canvas)
 
-        # Create empty data lists for graph.
-        self.data_x_csv = list()
-        self.data_x = list()
-        self.data_y = list()
+        # Create empty data buffer for graph. (Time, nVolt)
+        self.data = RingBuffer(self.CAPACITY, 2, spill=True)
 
         # Add axis.
         self.ax = self.figure.add_subplot(111)
@@ -59,7 +81,11 @@ class WidgetMain(QtWidgets.QWidget, WidgetMain.Ui_Form):
         self.ax.set(xlabel = "Time (s)")
 
         # Add temperature line.
-        self.line_temp, = self.ax.plot(self.data_x, self.data_y, c='b', ls='-')
+        self.line_temp, = self.ax.plot(self.data[0], self.data[1], c='b', ls='-')
+
+        # Incremental renderer, run by the scheduler.
+        self.plot = BlitPlot(self.canvas, self.toolbar, [self.line_temp])
+        self.scheduler.add(self, self.rescale)
         ''' End figure '''
 
         # Aquisition
@@ -67,26 +93,27 @@ class WidgetMain(QtWidgets.QWidget, WidgetMain.Ui_Form):
         self.btn_Aquire.clicked.connect(self.aquire)
 
         # Initial Time.
-        self.time_Init_nvolt = time.time()
-        # Create timer.
-        self.timer = QtCore.QTimer()
-        # Set interval from the spin box.
-        self.timer.setInterval(self.spin_interval.value())
-        # If interval changed in spin box, update timer interval.
-        self.spin_interval.valueChanged.connect(self.timer.setInterval)
-        # At timeout, update pid and graph.
-        self.timer.timeout.connect(self.update_graph)
-        self.timer.timeout.connect(self.wid_pid.worker.update)
+        self.time_Init_nvolt = Clock.now()
+        # Readings come in batches from the nVoltmeter sampler thread.
+        self.wid_nvolt.worker.sampled.connect(self.update_graph)
+        self.wid_nvolt.worker.ended.connect(self.nvolt_ended)
+        # PID loop runs on its own timer in the cDAQ thread. Set its period from the spin box.
+        self.spin_interval.valueChanged.connect(self.wid_pid.worker.set_period)
+        self.wid_pid.worker.set_period(self.spin_interval.value())
         self.wid_pid.worker.updated.connect(self.update_DAQData)
-        # Start timer.
-        self.timer.start()
+        self.wid_pid.worker.acquired.connect(self.record_DAQData)
+        # Injections of the pump schedule are recorded with the readings.
+        self.wid_pump.schedule.injection.connect(self.injected)
+        self.wid_pump.schedule.delivered.connect(self.update_delivered)
 
         # Start or stop recording when button pushed.
         self.btn_record.clicked.connect(self.record)
         self.btn_clear.clicked.connect(self.clear_chart)
 
-        # Init empty csv file variable.
-        self.csvfile = None
+        # Init empty recording writer variables. (nVoltmeter, hardware-timed cDAQ and events)
+        self.writer = None
+        self.daq_writer = None
+        self.events_writer = None
         self.header_status = False
 
         # Init data from DAQ
@@ -94,16 +121,27 @@ class WidgetMain(QtWidgets.QWidget, WidgetMain.Ui_Form):
         self.values = []
         self.units = []
 
+        # Init injections of the pump schedule, as [start, end, step] (end is inf while infusing), and volume
+        # delivered by the last one.
+        self.injections = []
+        self.delivered = np.nan
+        # Current steps of the source program run by the acquisition, as (time, step, current).
+        self.pulses = []
+
 
     def record(self):
-        if self.csvfile is None or self.csvfile.closed:     # If file is not opened.
+        if self.writer is None:     # If file is not opened.
             # Open file save dialog.
-            filename, ext = QtWidgets.QFileDialog.getSaveFileName(self, 'Save file', self.edit_path.text() or 'C:\\', 'CSV files (*.csv)')
+            filename, ext = QtWidgets.QFileDialog.getSaveFileName(self, 'Save file', self.edit_path.text() or 'C:\\', FILE_FILTER)
             self.header_status = False
             # If file selected.
             if filename != '':
                 try:
-                    self.csvfile = open(filename, mode='w+t')
+                    # Rows are written by a background thread. Format from the file extension. (CSV: time, nVolt,
+                    # injection step, delivered volume, then cDAQ values.)
+                    self.writer = RecordWriter(open_sink(filename, ('{}', '{}', '{:g}', '{:f}')))
+                    self.writer.error.connect(self.record_error)
+                    self.writer.start()
                     # Show path to saved file.
                     self.edit_path.setText(filename)
 
@@ -113,80 +151,163 @@ class WidgetMain(QtWidgets.QWidget, WidgetMain.Ui_Form):
                     self.ico_state.setPixmap(QtGui.QPixmap(".\\ico\\bullet_red.png"))
                 except IOError as e:
                     QtWidgets.QMessageBox.critical(self, 'Error', e.strerror)
-                self.time_Init_nvolt_csv = time.time()
+                self.time_Init_nvolt_csv = Clock.now()
+                # Current steps of the acquisition, started before the recording.
+                for timestamp, step, current in self.pulses:
+                    self.record_event(timestamp, 3, step, current, timestamp)
         else:   # If file is opened.
-            # Close the file.
-            self.csvfile.close()
+            # Write pending rows and close the files, in the background.
+            self.writer.stop(wait=False)
+            self.writer = None
+            if self.daq_writer is not None:
+                self.daq_writer.stop(wait=False)
+                self.daq_writer = None
+            if self.events_writer is not None:
+                self.events_writer.stop(wait=False)
+                self.events_writer = None
 
             # Update status.
             self.btn_record.setText('Save')
             self.lbl_state.setText('Not recording')
             self.ico_state.setPixmap(QtGui.QPixmap())
 
-    @QtCore.pyqtSlot()
-    def update_graph(self):
+    @QtCore.pyqtSlot(object, object)
+    @Perf.timed('main.update_graph')
+    def update_graph(self, times, values):
         """
-        Function executed periodically to read the nVoltmeter values and update the graph.
-        Also appends the time and value to the csv file if open.
+        Slot called with each batch of nVoltmeter readings from the sampler thread. Appends them to the graph data,
+        the graph is redrawn at the next frame. Also appends the times and values to the csv file if open.
         """
         if self.Aquire_Status:
-            # Append timestamp.
-            self.data_x.append(time.time()-self.time_Init_nvolt)
-            # Append nVolt reading.
-            self.data_y.append(self.wid_nvolt.fetch())
-            # Update plot.
-            self.line_temp.set_data(self.data_x, self.data_y)
-            self.rescale()
-
-            if self.csvfile is not None and not self.csvfile.closed:
-                self.data_x_csv.append(time.time() - self.time_Init_nvolt_csv)
+            # Append timestamps and nVolt readings.
+            self.data.extend(np.column_stack((times - self.time_Init_nvolt, values)))
+            # Update plot at next frame.
+            self.scheduler.request(self)
+
+            if self.writer is not None:
                 """ Header """
                 if not self.header_status:
-                    self.csvfile.write('{}, {}'.format("Time", "nVolt"))
-                    for i in range(len(self.names)):
-                        self.csvfile.write(', {}'.format(self.names[i]))
-                    self.csvfile.write('\n')
-                    self.csvfile.write('{}, {}'.format("Seconds", "Volts"))
-                    for i in range(len(self.names)):
-                        self.csvfile.write(', {}'.format(self.units[i]))
-                    self.csvfile.write('\n')
+                    self.writer.header(["Time", "nVolt", "Injection", "Delivered"] + self.names,
+                                       ["Seconds", "Volts", "Step", "ml"] + self.units)
+                    # Columns are fixed by the header.
+                    self.header_values = len(self.names)
                     self.header_status = True
 
                 """ Data """
-                self.csvfile.write("{},{}".format(self.data_x_csv[-1], self.data_y[-1]))
-                self.csvfile.flush()
-                for v in self.values:
-                    self.csvfile.write(', {0:f}'.format(v))
-                self.csvfile.write('\n')
-                self.csvfile.flush()
+                # Last cDAQ values on every row, padded if the cDAQ changed since the header.
+                daq = np.full(self.header_values, np.nan)
+                daq[:min(len(self.values), self.header_values)] = self.values[:self.header_values]
+                self.writer.write(np.column_stack((times - self.time_Init_nvolt_csv, values,
+                                                   self.injection_steps(times), np.full(len(times), self.delivered),
+                                                   np.tile(daq, (len(times), 1)))))
+
+    def injection_steps(self, times):
+        """
+        Returns the step of the injection running at each time (from 1), 0 if none.
+        """
+        steps = np.zeros(len(times))
+        # Most recent injections first, until before the times.
+        for start, end, step in reversed(self.injections):
+            if end < times[0]:
+                break
+            steps[(times >= start) & (times < end)] = step
+        return steps
+
+    @QtCore.pyqtSlot(int, bool, float, float)
+    def injected(self, step, started, timestamp, nominal):
+        """
+        Slot called at the start and the end of each injection of the pump schedule, with the time measured and the
+        nominal time.
+        """
+        if started:
+            self.injections.append([timestamp, np.inf, step + 1])
+            self.delivered = 0.0
+        elif self.injections:
+            self.injections[-1][1] = timestamp
+        self.record_event(timestamp, 1 if started else 2, step + 1, nominal=nominal)
+
+    @QtCore.pyqtSlot(float)
+    def update_delivered(self, volume):
+        self.delivered = volume
+
+    @QtCore.pyqtSlot(object, object)
+    def record_DAQData(self, times, block):
+        """
+        Slot called with each block of the hardware-timed cDAQ acquisition. Records it in a second file, next to the
+        nVoltmeter one (ex: run_daq.csv for run.csv).
+        """
+        if self.writer is not None:
+            if self.daq_writer is None:
+                root, ext = os.path.splitext(self.edit_path.text())
+                try:
+                    self.daq_writer = RecordWriter(open_sink(root + '_daq' + ext, ('{}',)), name='record.daq')
+                except IOError as e:
+                    QtWidgets.QMessageBox.critical(self, 'Error', e.strerror)
+                    self.record()
+                    return
+                self.daq_writer.error.connect(self.record_error)
+                self.daq_writer.start()
+                self.daq_writer.header(["Time"] + self.wid_pid.worker.names, ["Seconds"] + self.wid_pid.worker.units)
+            self.daq_writer.write(np.column_stack((times - self.time_Init_nvolt_csv, block.T)))
+
+    def record_event(self, timestamp, event, step, current=np.nan, nominal=np.nan):
+        """
+        Records an event in a third file, next to the nVoltmeter one (ex: run_events.csv for run.csv), with its exact
+        time, to align the readings on the injections and the current pulses.
+
+        :param timestamp: Time of the event (Clock).
+        :param event: 1 injection start, 2 injection end, 3 current step.
+        :param step: Step of the pump schedule or of the current source program (from 1).
+        :param current: Current of the step (A).
+        :param nominal: Time the event was expected at (Clock). The times of the current steps are nominal.
+        """
+        if self.writer is None:
+            return
+        if self.events_writer is None:
+            root, ext = os.path.splitext(self.edit_path.text())
+            try:
+                self.events_writer = RecordWriter(open_sink(root + '_events' + ext, ('{}', '{:g}', '{:g}', '{:f}', '{}')), name='record.events')
+            except IOError as e:
+                QtWidgets.QMessageBox.critical(self, 'Error', e.strerror)
+                self.record()
+                return
+            self.events_writer.error.connect(self.record_error)
+            self.events_writer.start()
+            self.events_writer.header(["Time", "Event", "Step", "Current", "Nominal time"],
+                                      ["Seconds", "1 injection start/2 injection end/3 current step", "", "µA",
+                                       "Seconds"])
+        self.events_writer.write([timestamp - self.time_Init_nvolt_csv, event, step, current * 1e6,
+                                  nominal - self.time_Init_nvolt_csv])
+
+    @QtCore.pyqtSlot(str)
+    def record_error(self, message):
+        # Writer thread stopped, stop recording.
+        QtWidgets.QMessageBox.critical(self, 'Error', message)
+        if self.writer is not None:
+            self.record()
 
 
     @QtCore.pyqtSlot()
     def clear_chart(self):
         # Reset Time axis
-        self.time_Init_nvolt = time.time()
+        self.time_Init_nvolt = Clock.now()
 
         # Clear all the graph data.
-        self.data_x.clear()
-        self.data_y.clear()
+        self.data.clear()
+        self.plot.set_data(self.line_temp, self.data[0], self.data[1])
 
         # Update scale.
-        self.rescale()
+        self.plot.redraw(self.check_autox.isChecked(), self.check_autoy.isChecked())
 
+    @Perf.timed('main.render')
     def rescale(self):
-        # Update limits.
-        self.ax.relim()
-        # Autoscale axes.
-        self.ax.autoscale(enable=self.check_autox.isChecked(), axis='x')
-        self.ax.autoscale(enable=self.check_autoy.isChecked(), axis='y')
-        # Redraw graph.
-        self.canvas.draw()
-        # Update toolbar home value.
-        self.toolbar.update()
-        self.figure.tight_layout()
-
-    @QtCore.pyqtSlot(list, list, list)
-    def update_DAQData(self, names, values, units):
+        # Update plot.
+        self.plot.set_data(self.line_temp, self.data[0], self.data[1])
+        # Blit the line, or redraw graph if the data left the view.
+        self.plot.update(self.check_autox.isChecked(), self.check_autoy.isChecked())
+
+    @QtCore.pyqtSlot(float, list, list, list)
+    def update_DAQData(self, timestamp, names, values, units):
         """
         Slot called when cDAQThread has finished updating
         """
@@ -201,14 +322,27 @@ class WidgetMain(QtWidgets.QWidget, WidgetMain.Ui_Form):
             self.Aquire_Status = True
             self.btn_Aquire.setText("Stop Aquisition")
             self.clear_chart()
-            self.wid_nvolt.btn_connect.setEnabled(False)
+            self.wid_nvolt.start()
+            self.pulses = []
             if self.checkBox_Calib.isChecked():
                 self.wid_courant.courant.write("P0F1T4X") # P0 = mode single, F1 activates output, T4 starts the output, X is used to execute command
+                # Mark the current steps of the program, timed from the start. Kept for a recording started later.
+                self.pulses = self.wid_courant.pulses(Clock.now())
+                for timestamp, step, current in self.pulses:
+                    self.record_event(timestamp, 3, step, current, timestamp)
 
         else:
-            self.Aquire_Status = False
             self.btn_Aquire.setText("Start Aquisition")
-            self.wid_nvolt.btn_connect.setEnabled(True)
+            if self.wid_nvolt.sampling:
+                # Last batch of readings sent when the sampler ends, acquisition stopped then.
+                self.wid_nvolt.stop()
+            else:
+                self.Aquire_Status = False
+
+    @QtCore.pyqtSlot()
+    def nvolt_ended(self):
+        # Sampler stopped, its last readings received.
+        self.Aquire_Status = False
 
 
 
@@ -234,8 +368,11 @@ if __name__ == "__main__":
     # Define app
     app = QtWidgets.QApplication(sys.argv)
 
-    # Create widgets
-    main = WidgetMain()
+    # Create widgets. Simulated hardware with --simulate, hardware-timed cDAQ acquisition with --daq-rate <Hz>.
+    daq_rate = WidgetMain.DAQ_RATE
+    if '--daq-rate' in sys.argv:
+        daq_rate = float(sys.argv[sys.argv.index('--daq-rate') + 1])
+    main = WidgetMain('--simulate' in sys.argv, daq_rate)
 
     # Show window.
     mainwind = QtWidgets.QMainWindow()
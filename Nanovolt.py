@@ -1,14 +1,139 @@
+import collections
 import numpy as np
 import re
-import visa
 from PyQt5 import QtCore, QtWidgets, QtGui
+from pyvisa.constants import EventMechanism, EventType, StatusCode
 
+import Clock
+import Perf
 from WidgetNanovolt import Ui_WidgetNanovolt
 from DialogNanovolt import Ui_DialogNanovolt
 
+# Data formats of the readings as (SCPI name, pyvisa datatype). Binary formats are sent little endian (:FORM:BORD SWAP).
+DATA_FORMATS = {'ASCII': ('ASC', None), 'SREAL': ('SRE', 'f'), 'DREAL': ('DRE', 'd')}
+
+# VISA service request event, queued, and status code of a timeout.
+SERVICE_REQUEST = EventType.service_request
+EVENT_QUEUE = EventMechanism.queue
+ERROR_TIMEOUT = StatusCode.error_timeout
+
+
+def query_readings(nvolt, message, data_format):
+    """
+    Queries readings (:FETC?, :SENS:DATA:FRES?, :TRAC:DATA?) in the data format set on the instrument.
+
+    :param data_format: Key of DATA_FORMATS.
+    :return: Readings as a numpy array.
+    """
+    datatype = DATA_FORMATS[data_format][1]
+    if datatype is None:
+        return np.array(nvolt.query(message).split(','), dtype=float)
+    return np.array(nvolt.query_binary_values(message, datatype=datatype, is_big_endian=False, container=np.array),
+                    dtype=float)
+
+
+def normalize(value):
+    """
+    Returns a setting in a comparable form: number, or upper case string without quotes. ON/OFF as 1/0.
+    Ex: '+1.000000E-02' -> 0.01, '"VOLT:DC"' -> 'VOLT'.
+    """
+    value = str(value).strip().strip('"').upper()
+    value = {'ON': '1', 'OFF': '0', 'INF': '9.9E37'}.get(value, value)
+    if value.endswith(':DC'):
+        value = value[:-3]
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+class NanovoltSettings:
+    """
+    Last known configuration of the nVoltmeter, by SCPI header. Queried in one message, and only the settings that
+    changed are sent, in one message.
+    The cache is only valid while the configuration is changed through it: it is cleared at connection and on recall.
+    """
+
+    # Settings of the configuration dialog, for both channels.
+    HEADERS = ((':SENS:FUNC', ':SENS:CHAN') +
+               tuple(':SENS:VOLT:CHAN' + chan + setting for chan in '12'
+                     for setting in (':RANG', ':RANG:AUTO', ':LPAS', ':DFIL', ':DFIL:COUN', ':DFIL:TCON')) +
+               (':SYST:LSYN', ':SENS:VOLT:NPLC', ':TRAC:POIN', ':TRAC:FEED', ':TRIG:SOUR', ':TRIG:COUN', ':SAMP:COUN',
+                ':INIT:CONT'))
+    # Memory slots of *SAV and *RCL.
+    SLOTS = range(5)
+
+    def __init__(self):
+        self.values = dict()
+
+    def clear(self):
+        self.values.clear()
+
+    def get(self, nvolt):
+        """
+        Returns the configuration, queried if not known.
+
+        :return: Dictionary of the answers by header.
+        """
+        if not self.values:
+            answers = nvolt.query(';'.join(header + '?' for header in self.HEADERS)).strip().split(';')
+            self.values.update(zip(self.HEADERS, answers))
+        return self.values
+
+    def diff(self, settings):
+        """
+        Returns the settings that differ from the last known configuration. The range of a channel is always sent
+        when autorange was on: the instrument changed it.
+
+        :param settings: Ordered dictionary of the values by header.
+        :return: Ordered dictionary of the changed values by header, in the same order.
+        """
+        return collections.OrderedDict((header, value) for header, value in settings.items()
+                                       if header not in self.values or self.autoranged(header) or
+                                       normalize(self.values[header]) != normalize(value))
+
+    def autoranged(self, header):
+        """Returns True if the header is the range of a channel with autorange on in the last known configuration."""
+        return header.endswith(':RANG') and normalize(self.values.get(header + ':AUTO', 0)) == 1
+
+    def push(self, nvolt, settings, commands=()):
+        """
+        Sends the changed settings in one message.
+
+        :param settings: Ordered dictionary of the values by header. Sent in order.
+        :param commands: Commands sent first, in the same message (:TRAC:CLE...).
+        :return: Ordered dictionary of the values sent by header.
+        """
+        changed = self.diff(settings)
+        message = ';'.join(list(commands) + ['{} {}'.format(header, value) for header, value in changed.items()])
+        if message:
+            nvolt.write(message)
+        self.values.update(changed)
+        return changed
+
+    def save(self, nvolt, slot):
+        """Saves the configuration of the instrument in a memory slot."""
+        nvolt.write('*SAV {}'.format(slot))
+
+    def recall(self, nvolt, slot):
+        """Recalls the configuration saved in a memory slot. The configuration is queried again on next get."""
+        nvolt.write('*RCL {}'.format(slot))
+        self.clear()
+
 
 class WidgetNanovolt(QtWidgets.QWidget, Ui_WidgetNanovolt):
-    def __init__(self, res_man, btn_aquire):
+    # Signals to interface thread.
+    s_start = QtCore.pyqtSignal(object, int, str, bool)
+    s_stop = QtCore.pyqtSignal()
+
+    # Data format of the readings set at connection. Binary single floats: 4 bytes per reading instead of 16.
+    DATA_FORMAT = 'SREAL'
+
+    def __init__(self, res_man, btn_aquire=None):
+        """
+        :param res_man: VISA resource manager.
+        :param btn_aquire: Acquisition button, enabled while connected. None if standalone.
+        """
         # Initialise overloaded classes.
         super().__init__()
         self.setupUi(self)
@@ -18,6 +143,13 @@ class WidgetNanovolt(QtWidgets.QWidget, Ui_WidgetNanovolt):
 
         # Init variable.
         self.nvolt = None
+        # Size of the instrument buffer in buffered mode, 0 to read one reading at a time. Set by DialogNanovolt.
+        self.buffer_points = 0
+        self.data_format = 'ASCII'
+        # Read when the instrument requests service instead of polling it. Set by DialogNanovolt.
+        self.srq = False
+        # Last known configuration of the device.
+        self.settings = NanovoltSettings()
 
         # List ports and filter for GPIB devices only.
         self.combo_port.addItems(filter(lambda k: 'GPIB' in k, self.rm.list_resources()))
@@ -28,6 +160,22 @@ class WidgetNanovolt(QtWidgets.QWidget, Ui_WidgetNanovolt):
         self.btn_config.clicked.connect(self.config)
         self.connect_status.setPixmap(QtGui.QPixmap(".\\ico\\WX_circle_red.png"))
 
+        # Start sampler thread.
+        self.thread = QtCore.QThread()
+        self.worker = NanovoltThread()
+        self.worker.moveToThread(self.thread)
+        self.thread.started.connect(self.worker.start)
+        self.worker.finished.connect(self.thread.quit)
+        self.destroyed.connect(self.worker.stop)
+        self.worker.sampled.connect(self.sampled)
+        self.s_start.connect(self.worker.begin)
+        self.s_stop.connect(self.worker.end)
+        self.worker.ended.connect(self.ended)
+        self.thread.start()
+        # Sampling, and stop requested to the sampler thread (device still used by it until ended).
+        self.sampling = False
+        self.stopping = False
+
         # Update GUI.
         self.update_status()
 
@@ -35,10 +183,13 @@ class WidgetNanovolt(QtWidgets.QWidget, Ui_WidgetNanovolt):
     def connect(self):
         # If closed, open.
         if self.nvolt is None:
-            # Open device.
+            # Open device. Configuration unknown.
             self.nvolt = self.rm.open_resource(self.combo_port.currentText())
+            self.settings.clear()
             # Query channel.
             self.lbl_channel.setText('CH' + self.nvolt.query(':SENSE:CHANNEL?')[0] + ':')
+            # Transfer readings in binary.
+            self.set_format(self.DATA_FORMAT)
         else:
             # Close device.
             self.nvolt.close()
@@ -47,6 +198,43 @@ class WidgetNanovolt(QtWidgets.QWidget, Ui_WidgetNanovolt):
             self.lbl_value.setText('NA')
         self.update_status()
 
+    def set_format(self, data_format):
+        """
+        Sets the data format of the readings on the instrument.
+
+        :param data_format: Key of DATA_FORMATS.
+        """
+        self.nvolt.write(':FORM:BORD SWAP;:FORM:DATA ' + DATA_FORMATS[data_format][0])
+        self.data_format = data_format
+
+    def start(self):
+        """
+        Starts sampling the nVoltmeter in the worker thread.
+        The device must not be used from the GUI thread until stop is called.
+        """
+        if self.nvolt is not None and not self.sampling:
+            self.sampling = True
+            self.s_start.emit(self.nvolt, self.buffer_points, self.data_format, self.srq)
+            self.update_status()
+
+    def stop(self):
+        """
+        Stops sampling the nVoltmeter. The device is released when the sampler thread has ended.
+        """
+        if self.sampling and not self.stopping:
+            self.stopping = True
+            self.s_stop.emit()
+            self.update_status()
+
+    @QtCore.pyqtSlot()
+    def ended(self):
+        """
+        Slot called when the sampler thread has stopped using the device.
+        """
+        self.sampling = False
+        self.stopping = False
+        self.update_status()
+
     def config(self):
         # Show configuration dialog.
         dialog = DialogNanovolt(self)
@@ -60,16 +248,20 @@ class WidgetNanovolt(QtWidgets.QWidget, Ui_WidgetNanovolt):
             self.btn_connect.setEnabled(self.combo_port.currentIndex() != -1)
             self.combo_port.setEnabled(True)
             self.btn_config.setEnabled(False)
-            self.btn_aquire.setEnabled(False)
+            if self.btn_aquire is not None:
+                self.btn_aquire.setEnabled(False)
             self.connect_status.setPixmap(QtGui.QPixmap(".\\ico\\WX_circle_red.png"))
 
         # Close it if open.
         else:
             self.btn_connect.setText('Disconnect')
-            self.btn_connect.setEnabled(True)
+            # Device belongs to the sampler thread while sampling.
+            self.btn_connect.setEnabled(not self.sampling)
             self.combo_port.setEnabled(False)
-            self.btn_config.setEnabled(True)
-            self.btn_aquire.setEnabled(True)
+            self.btn_config.setEnabled(not self.sampling)
+            # Can not start again until stopped.
+            if self.btn_aquire is not None:
+                self.btn_aquire.setEnabled(not self.stopping)
             self.connect_status.setPixmap(QtGui.QPixmap(".\\ico\\WX_circle_green.png"))
 
     def fetch(self):
@@ -79,22 +271,234 @@ class WidgetNanovolt(QtWidgets.QWidget, Ui_WidgetNanovolt):
             return np.nan
         else:
             # If connected, fetch the value.
-            value = float(self.nvolt.query(':FETC?'))
+            value = query_readings(self.nvolt, ':FETC?', self.data_format)[0]
             if abs(value) > 100:
                 # If out of range, return NaN.
-                self.lbl_value.setText('OVERFLOW')
-                return np.nan
-            else:
-                # Format value with units and return value.
-                if abs(value) < 1e-6:
-                    self.lbl_value.setText("{:.3f} nV".format(value * 1e9))
-                elif abs(value) < 1e-3:
-                    self.lbl_value.setText("{:.3f} µV".format(value * 1e6))
-                elif abs(value) < 1:
-                    self.lbl_value.setText("{:.3f} mv".format(value * 1e3))
-                else:
-                    self.lbl_value.setText("{:.3f} V".format(value))
-                return value
+                value = np.nan
+            self.display(value)
+            return value
+
+    @QtCore.pyqtSlot(object, object)
+    @Perf.timed('nvolt.display')
+    def sampled(self, times, values):
+        """
+        Slot called when the sampler thread sends a batch of readings. Shows the last one.
+        """
+        if len(values):
+            self.display(values[-1])
+
+    def display(self, value):
+        if np.isnan(value):
+            # Out of range.
+            self.lbl_value.setText('OVERFLOW')
+        # Format value with units.
+        elif abs(value) < 1e-6:
+            self.lbl_value.setText("{:.3f} nV".format(value * 1e9))
+        elif abs(value) < 1e-3:
+            self.lbl_value.setText("{:.3f} µV".format(value * 1e6))
+        elif abs(value) < 1:
+            self.lbl_value.setText("{:.3f} mv".format(value * 1e3))
+        else:
+            self.lbl_value.setText("{:.3f} V".format(value))
+
+
+class NanovoltThread(QtCore.QObject):
+    """
+    Thread class. Used to read the nVoltmeter as fast as it converts and send the timestamped readings to the GUI
+    in batches, so the GPIB round-trips never block the GUI thread.
+    In buffered mode, the instrument stores the readings in its buffer on its own trigger model. The thread polls the
+    buffer full status and reads the whole buffer with one query, then re-arms it.
+    In SRQ mode, the instrument requests service when a reading is available (or the buffer is full) and the thread
+    waits for the request, blocked in VISA, instead of polling.
+    """
+
+    finished = QtCore.pyqtSignal()
+    sampled = QtCore.pyqtSignal(object, object)
+    # Device no longer used by the thread.
+    ended = QtCore.pyqtSignal()
+
+    # Minimum time between two batches sent to the GUI (s).
+    BATCH_INTERVAL = 0.1
+    # Time between two polls of the buffer status in buffered mode (s).
+    POLL_INTERVAL = 0.02
+    # Bits of the measurement event register set when the buffer is full (BFL) and when a reading is available (RAV).
+    BUFFER_FULL = 512
+    READING_AVAILABLE = 32
+    # Longest wait for a service request (ms). The thread handles the stop requests between two waits.
+    SRQ_TIMEOUT = 100
+
+    @QtCore.pyqtSlot()
+    def start(self):
+        # Init device and mode (set when sampling begins).
+        self.nvolt = None
+        self.points = 0
+        self.data_format = 'ASCII'
+        self.srq = False
+        self.requested = None
+
+        # Init batch.
+        self.times = list()
+        self.values = list()
+        self.last_batch = Clock.now()
+
+        # Zero interval timer: read again as soon as the previous reading is processed.
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(0)
+        self.timer.timeout.connect(self.read)
+
+    @QtCore.pyqtSlot()
+    def stop(self):
+        self.end()
+        self.finished.emit()
+
+    @QtCore.pyqtSlot(object, int, str, bool)
+    def begin(self, nvolt, points=0, data_format='ASCII', srq=False):
+        """
+        Starts reading the given device.
+
+        :param points: Size of the instrument buffer in buffered mode (configured by DialogNanovolt), 0 to read one
+            reading at a time.
+        :param data_format: Data format of the readings set on the device, key of DATA_FORMATS.
+        :param srq: Wait for the service requests of the device instead of polling it.
+        """
+        self.nvolt = nvolt
+        self.points = points
+        self.data_format = data_format
+        self.srq = srq
+        self.times.clear()
+        self.values.clear()
+        self.last_batch = Clock.now()
+        try:
+            if srq:
+                self.enable_srq()
+            if points:
+                self.arm()
+        except Exception as err:
+            print(err)
+            return
+        if points and not srq:
+            # Poll the buffer status.
+            self.timer.start(int(self.POLL_INTERVAL * 1000))
+        else:
+            # Read (or wait for the next request) as soon as the previous reading is processed.
+            self.timer.start(0)
+
+    @QtCore.pyqtSlot()
+    def end(self):
+        """
+        Stops reading and sends the last readings.
+        """
+        self.timer.stop()
+        self.send()
+        if self.srq and self.nvolt is not None:
+            try:
+                self.disable_srq()
+            except Exception as err:
+                print(err)
+        self.nvolt = None
+        self.ended.emit()
+
+    def enable_srq(self):
+        """
+        Makes the device request service on buffer full in buffered mode, on reading available otherwise, and queues
+        the requests.
+        """
+        event = self.BUFFER_FULL if self.points else self.READING_AVAILABLE
+        # Clear the events of the previous readings first, only the next ones request service.
+        self.nvolt.write('*CLS;:STAT:MEAS:ENAB {};*SRE 1'.format(event))
+        self.nvolt.discard_events(SERVICE_REQUEST, EVENT_QUEUE)
+        self.nvolt.enable_event(SERVICE_REQUEST, EVENT_QUEUE)
+
+    def disable_srq(self):
+        self.nvolt.disable_event(SERVICE_REQUEST, EVENT_QUEUE)
+        self.nvolt.discard_events(SERVICE_REQUEST, EVENT_QUEUE)
+        self.nvolt.write('*SRE 0;:STAT:MEAS:ENAB 0')
+
+    def wait_srq(self):
+        """
+        Waits for a service request of the device, at most SRQ_TIMEOUT.
+
+        :return: True if the device requested service.
+        """
+        try:
+            self.nvolt.wait_on_event(SERVICE_REQUEST, self.SRQ_TIMEOUT)
+            # Reading (or buffer) completed now.
+            self.requested = Clock.now()
+            # Serial poll releases the SRQ line.
+            with Perf.measure('nvolt.srq'):
+                self.nvolt.read_stb()
+                # Reading available: clear the event register so the next reading requests service again. (Cleared
+                # by read_buffer in buffered mode.)
+                if not self.points:
+                    self.nvolt.query(':STAT:MEAS:EVEN?')
+        except Exception as err:
+            if getattr(err, 'error_code', None) != ERROR_TIMEOUT:
+                print(err)
+            return False
+        return True
+
+    def arm(self):
+        """
+        Clears the buffer and starts filling it with the next readings.
+        """
+        self.nvolt.write(':TRAC:CLE;:TRAC:FEED:CONT NEXT')
+        self.armed = Clock.now()
+
+    @QtCore.pyqtSlot()
+    def read(self):
+        if self.srq and not self.wait_srq():
+            return
+
+        if self.points:
+            self.read_buffer()
+            return
+
+        try:
+            # Wait for a new reading. (Paced by the instrument NPLC setting, never reads the same sample twice. Returns
+            # at once in SRQ mode.)
+            with Perf.measure('nvolt.query'):
+                value = query_readings(self.nvolt, ':SENS:DATA:FRES?', self.data_format)[0]
+        except Exception as err:
+            print(err)
+            return
+
+        # Append timestamp (of the service request if any) and reading. If out of range, append NaN.
+        self.times.append(self.requested if self.srq else Clock.now())
+        self.values.append(value if abs(value) <= 100 else np.nan)
+
+        # Send batch if enough time elapsed.
+        if self.times[-1] - self.last_batch >= self.BATCH_INTERVAL:
+            self.send()
+
+    def read_buffer(self):
+        """
+        Reads the buffer if full, and sends its readings as one batch.
+        """
+        try:
+            # Reading the event register clears it.
+            if not int(self.nvolt.query(':STAT:MEAS:EVEN?')) & self.BUFFER_FULL:
+                return
+            now = self.requested if self.srq else Clock.now()
+            with Perf.measure('nvolt.buffer'):
+                values = query_readings(self.nvolt, ':TRAC:DATA?', self.data_format)
+            start = self.armed
+            self.arm()
+        except Exception as err:
+            print(err)
+            return
+
+        # If out of range, NaN.
+        values[np.abs(values) > 100] = np.nan
+        # Readings are evenly spaced between the arming and the full status.
+        times = start + (np.arange(len(values)) + 1) * ((now - start) / len(values))
+        self.sampled.emit(times, values)
+
+    def send(self):
+        if self.times:
+            self.sampled.emit(np.array(self.times), np.array(self.values))
+            self.times.clear()
+            self.values.clear()
+        self.last_batch = Clock.now()
 
 
 class DialogNanovolt(QtWidgets.QDialog, Ui_DialogNanovolt):
@@ -109,43 +513,37 @@ class DialogNanovolt(QtWidgets.QDialog, Ui_DialogNanovolt):
         # Connect slots.
         self.buttonBox.accepted.connect(self.send_config)
         self.combo_channel.currentIndexChanged.connect(self.channel_changed)
+        self.btn_save.clicked.connect(self.save)
+        self.btn_recall.clicked.connect(self.recall)
 
         # Get the configuration from the instruments and update widgets.
         self.get_config()
 
     def get_config(self):
-        # Query function and channel.
-        config = self.wid.nvolt.query(':SENSE:FUNCTION?;:SENSE:CHANNEL?')
+        # Get the configuration, queried from the instrument if not known. Values as sent or as answered, compared
+        # normalized.
+        config = self.wid.settings.get(self.wid.nvolt)
 
-        # Split function and channel.
-        func, chan = re.search(r'"(.*)";(\d)', config).groups()
+        # Function and channel.
+        func = str(normalize(config[':SENS:FUNC']))
+        chan = str(int(normalize(config[':SENS:CHAN'])))
 
         # If function is not voltage, warn the user.
-        if func != 'VOLT:DC':
+        if func != 'VOLT':
             QtWidgets.QMessageBox.warning(self, 'Warning', "Current mode is: " + func +
                                           "\nMode will be changed when accepting configuration dialog.")
 
         # Set the channel in the combo box.
         self.combo_channel.setCurrentIndex(int(chan) - 1)
 
-        # Get all the configuration.
-        config = self.wid.nvolt.query(':SENSE:VOLT:CHAN' + chan + ':RANGE?;' +
-                                      ':SENSE:VOLT:CHAN' + chan + ':RANGE:AUTO?;' +
-                                      ':SENSE:VOLT:CHAN' + chan + ':LPASS?;' +
-                                      ':SENSE:VOLT:CHAN' + chan + ':DFIL?;' +
-                                      ':SENSE:VOLT:CHAN' + chan + ':DFIL:COUNT?;' +
-                                      ':SENSE:VOLT:CHAN' + chan + ':DFIL:TCON?;' +
-                                      ':SYST:LSYNC?;' +
-                                      ':SENS:VOLT:NPLC?')
-
-        # Split the configuration.
-        config = re.split(r'[;\n]', config)
+        # Settings of the channel.
+        prefix = ':SENS:VOLT:CHAN' + chan + ':'
 
         # Set range in the combo box.
-        if config[1] == '1':
+        if normalize(config[prefix + 'RANG:AUTO']) == 1:
             self.combo_range.setCurrentIndex(self.combo_range.findText('Autoscale'))
         else:
-            rang = float(config[0])
+            rang = normalize(config[prefix + 'RANG'])
             if rang <= 0.01:
                 self.combo_range.setCurrentIndex(self.combo_range.findText('10 mV'))
             elif rang <= 0.1:
@@ -158,75 +556,118 @@ class DialogNanovolt(QtWidgets.QDialog, Ui_DialogNanovolt):
                 self.combo_range.setCurrentIndex(self.combo_range.findText('100 V'))
 
         # Set the filter checkboxes.
-        self.check_analog.setChecked(config[2] == '1')
-        self.group_digital.setChecked(config[3] == '1')
+        self.check_analog.setChecked(normalize(config[prefix + 'LPAS']) == 1)
+        self.group_digital.setChecked(normalize(config[prefix + 'DFIL']) == 1)
 
         # Set the filter count.
-        self.spin_filter.setValue(int(config[4]))
+        self.spin_filter.setValue(int(normalize(config[prefix + 'DFIL:COUN'])))
 
         # Set the filter mode.
-        if config[5] == 'MOV':
+        tcon = normalize(config[prefix + 'DFIL:TCON'])
+        if tcon in ('MOV', 'MOVING'):
             self.radio_moving.setChecked(True)
-        elif config[5] == 'REP':
+        elif tcon in ('REP', 'REPEAT'):
             self.radio_repeating.setChecked(True)
         else:
             QtWidgets.QMessageBox.warning(self, 'Warning', 'Invalid digital filter mode')
 
         # Set the line cycle synchronisation.
-        self.check_lsync.setChecked(config[6] == '1')
+        self.check_lsync.setChecked(normalize(config[':SYST:LSYN']) == 1)
 
         # Set the rate.
-        self.spin_rate.setValue(float(config[7]))
+        self.spin_rate.setValue(normalize(config[':SENS:VOLT:NPLC']))
+
+        # Set the buffered acquisition and the service requests, as last sent.
+        self.group_buffer.setChecked(self.wid.buffer_points > 0)
+        if self.wid.buffer_points:
+            self.spin_buffer.setValue(self.wid.buffer_points)
+        self.check_srq.setChecked(self.wid.srq)
 
     def send_config(self):
         # Set channel.
         chan = str(self.combo_channel.currentIndex() + 1)
+        prefix = ':SENS:VOLT:CHAN' + chan + ':'
 
-        # Send function and channel.
-        self.wid.nvolt.write(':SENS:FUNC "VOLT";' +
-                             ':SENS:CHAN ' + chan)
+        # Settings in the order they are sent. Function and channel first.
+        settings = collections.OrderedDict()
+        settings[':SENS:FUNC'] = '"VOLT"'
+        settings[':SENS:CHAN'] = chan
 
         # Set label in parent widget. TODO: move to parent widget.
         self.wid.lbl_channel.setText('CH' + chan + ':')
 
-        # Send range.
+        # Range.
         rang = self.combo_range.currentText()
         if rang == 'Autoscale':
-            self.wid.nvolt.write(':SENSE:VOLT:CHAN' + chan + ':RANGE:AUTO 1')
+            settings[prefix + 'RANG:AUTO'] = '1'
         else:
             # Set range to manual.
-            self.wid.nvolt.write(':SENSE:VOLT:CHAN' + chan + ':RANGE:AUTO 0')
+            settings[prefix + 'RANG:AUTO'] = '0'
             # Split value and units.
             val, units = re.search(r'(\d*).*?(mV|V)', rang).groups()
             if units == 'mV':
                 # Send (value / 1000) if units are mV.
-                self.wid.nvolt.write(':SENSE:VOLT:CHAN{0}:RANGE {1:0.2f}'.format(chan, float(val) / 1000))
+                settings[prefix + 'RANG'] = '{:0.2f}'.format(float(val) / 1000)
             elif units == 'V':
                 # Send value if units are V.
-                self.wid.nvolt.write(':SENSE:VOLT:CHAN{0}:RANGE {1}'.format(chan, val))
+                settings[prefix + 'RANG'] = val
             else:
                 QtWidgets.QMessageBox.warning(self, 'Warning', 'Invalid range')
 
-        # Send line cycle synchronization setting.
-        self.wid.nvolt.write(':SYST:LSYNC ' + ('1' if self.check_lsync.isChecked() else '0'))
+        # Line cycle synchronization setting.
+        settings[':SYST:LSYN'] = '1' if self.check_lsync.isChecked() else '0'
 
-        # Send rate.
-        self.wid.nvolt.write(':SENS:VOLT:NPLC ' + str(self.spin_rate.value()))
+        # Rate.
+        settings[':SENS:VOLT:NPLC'] = str(self.spin_rate.value())
 
-        # Send analog filter setting.
-        self.wid.nvolt.write(':SENSE:VOLT:CHAN' + chan + ':LPASS ' + ('1' if self.check_analog.isChecked() else '0'))
+        # Analog filter setting.
+        settings[prefix + 'LPAS'] = '1' if self.check_analog.isChecked() else '0'
 
-        # Send digital filter settings.
+        # Digital filter settings.
         if self.group_digital.isChecked():
-            self.wid.nvolt.write(':SENSE:VOLT:CHAN' + chan + ':DFIL 1;' +
-                                 ':SENSE:VOLT:CHAN' + chan + ':DFIL:COUNT ' +
-                                 str(self.spin_filter.value()) + ';' +
-                                 ':SENSE:VOLT:CHAN' + chan + ':DFIL:TCON ' +
-                                 ('MOV' if self.radio_moving.isChecked() else 'REP'))
+            settings[prefix + 'DFIL'] = '1'
+            settings[prefix + 'DFIL:COUN'] = str(self.spin_filter.value())
+            settings[prefix + 'DFIL:TCON'] = 'MOV' if self.radio_moving.isChecked() else 'REP'
         else:
-            self.wid.nvolt.write(':SENSE:VOLT:CHAN' + chan + ':DFIL 0')
-
-        # TODO: send *SAV to save settings in the instrument memory.
+            settings[prefix + 'DFIL'] = '0'
+
+        # Buffered acquisition settings. Trigger continuously, one reading per trigger, buffer armed by the sampler.
+        # Buffer cleared first if its settings change, stopped if not buffered anymore.
+        commands = list()
+        if self.group_buffer.isChecked():
+            settings[':TRAC:POIN'] = str(self.spin_buffer.value())
+            settings[':TRAC:FEED'] = 'SENS'
+            settings[':TRIG:SOUR'] = 'IMM'
+            settings[':TRIG:COUN'] = 'INF'
+            settings[':SAMP:COUN'] = '1'
+            settings[':INIT:CONT'] = '1'
+            if any(header.startswith(':TRAC') for header in self.wid.settings.diff(settings)):
+                commands.append(':TRAC:CLE')
+            self.wid.buffer_points = self.spin_buffer.value()
+        else:
+            if self.wid.buffer_points:
+                commands.extend((':TRAC:CLE', ':TRAC:FEED:CONT NEV'))
+            self.wid.buffer_points = 0
+
+        # Send the changed settings in one message.
+        self.wid.settings.push(self.wid.nvolt, settings, commands)
+
+        # Read on service request. (Enabled on the instrument by the sampler thread.)
+        self.wid.srq = self.check_srq.isChecked()
+
+    def save(self):
+        """
+        Sends the configuration and saves it in the selected memory slot of the instrument.
+        """
+        self.send_config()
+        self.wid.settings.save(self.wid.nvolt, self.spin_slot.value())
+
+    def recall(self):
+        """
+        Recalls the configuration saved in the selected memory slot of the instrument and shows it.
+        """
+        self.wid.settings.recall(self.wid.nvolt, self.spin_slot.value())
+        self.get_config()
 
     def channel_changed(self):
         # Save the selected range.
@@ -247,12 +688,13 @@ class DialogNanovolt(QtWidgets.QDialog, Ui_DialogNanovolt):
 
 if __name__ == "__main__":
     import sys
+    from Drivers import resource_manager
 
     # Define app
     app = QtWidgets.QApplication(sys.argv)
 
-    # Create widget.
-    wid = WidgetNanovolt(visa.ResourceManager())
+    # Create widget. Simulated instruments with --simulate.
+    wid = WidgetNanovolt(resource_manager('--simulate' in sys.argv))
 
     # Change label font. (Bigger for standalone app)
     font = QtGui.QFont()
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class PID:
     """
     PID Controller
@@ -74,6 +77,77 @@ class PID:
         # Return output.
         return pid
 
+    def run(self, feedback_values, timestamps):
+        """
+        Computes the PID values for arrays of feedback values and timestamps, as successive calls to update would
+        (same results, bit for bit), and leaves the controller in the same state.
+        Used to replay recorded data. Samples are processed by vectorized blocks, a block is cut at the first sample
+        where the output saturates; saturated samples are computed with update.
+
+        :return: Array of PID values.
+        """
+        feedback_values = np.asarray(feedback_values, dtype=float)
+        timestamps = np.asarray(timestamps, dtype=float)
+        out = np.empty(len(feedback_values))
+        # Python floats for the scalar updates. (Faster than NumPy scalars.)
+        feedback_list = feedback_values.tolist()
+        timestamps_list = timestamps.tolist()
+
+        # Block size, reduced while saturating, doubled while not.
+        start = 0
+        size = 16
+        while start < len(out):
+            stop = min(start + size, len(out))
+
+            # Compute e(t) and previous e(t) of the block.
+            error = self.SetPoint - feedback_values[start:stop]
+            last_error = np.concatenate(([self.last_error], error[:-1]))
+            # Compute dt.
+            delta_time = timestamps[start:stop] - np.concatenate(([self.last_timestamp], timestamps[start:stop - 1]))
+
+            # Proportionnal value.
+            p = error
+
+            # Integral value. (Accumulated in the same order as update.)
+            i = (error + last_error) * delta_time / 2
+            if self.Ti != 0:
+                i /= self.Ti
+            i = np.cumsum(np.concatenate(([self.last_integral], i)))[1:]
+
+            # Derivative value.
+            d = (error - last_error) * self.Td
+            d = np.divide(d, delta_time, out=d, where=delta_time != 0)
+
+            # Sum PID values.
+            pid = self.Kp * (p + i + d)
+
+            # Keep the block up to the first saturated value.
+            saturated = np.flatnonzero(np.abs(pid) > self.Guard)
+            n = saturated[0] if len(saturated) else len(pid)
+            out[start:start + n] = pid[:n]
+            if n:
+                self.last_timestamp = timestamps_list[start + n - 1]
+                self.last_error = float(error[n - 1])
+                self.last_integral = float(i[n - 1])
+
+            # Saturated values computed by update, until the output leaves the maximum.
+            if n < len(pid):
+                start += n
+                scalar = list()
+                while start < len(out):
+                    pid = self.update(feedback_list[start], timestamps_list[start])
+                    scalar.append(pid)
+                    start += 1
+                    if abs(pid) != self.Guard:
+                        break
+                out[start - len(scalar):start] = scalar
+                size = 16
+            else:
+                start = stop
+                size = min(size * 2, 4096)
+
+        return out
+
     def set_point(self, set_p):
         """Changes the PID setpoint value."""
         self.SetPoint = set_p
@@ -93,3 +167,79 @@ class PID:
     def set_guard(self, maximum):
         """Changes the PID maximum output value."""
         self.Guard = maximum
+
+
+class PIDBank:
+    """
+    Bank of PID controllers using the same algorithm as PID, with one set of gains (and set point) per controller.
+    All the controllers are updated at once with NumPy, with the same results as PID, bit for bit.
+    Used to compare many gain sets on the same recorded data, ex: PIDBank(k_p=kp_grid, t_i=ti_grid).
+    """
+
+    def __init__(self, timestamp=0, k_p=0.2, t_i=0.0, t_d=0.0, maximum=100.0, set_point=25):
+        # One value per controller, scalars are broadcast.
+        self.SetPoint, self.Kp, self.Ti, self.Td, self.Guard = \
+            np.broadcast_arrays(*[np.array(v, dtype=float) for v in (set_point, k_p, t_i, t_d, maximum)])
+
+        # Remember last time and last error for next calculation
+        self.clear(timestamp)
+
+    def clear(self, timestamp):
+        """Clears PID computations."""
+        self.last_timestamp = timestamp
+        self.last_error = np.zeros(self.Kp.shape)
+        self.last_integral = np.zeros(self.Kp.shape)
+
+    def update(self, feedback_value, timestamp):
+        """
+        Computes the PID value of every controller for given reference feedback and timestamp.
+
+        :return: Array of PID values, one per controller.
+        """
+        # Compute e(t).
+        error = self.SetPoint - feedback_value
+        # Compute dt.
+        delta_time = timestamp - self.last_timestamp
+
+        # Proportionnal value.
+        p = error
+
+        # Integral value.
+        i = (error + self.last_error) * delta_time / 2
+        i = np.divide(i, self.Ti, out=i, where=self.Ti != 0)
+        i += self.last_integral
+
+        # Derivative value.
+        d = (error - self.last_error) * self.Td
+        if delta_time != 0:
+            d /= delta_time
+
+        # Sum PID values.
+        pid = self.Kp * (p + i + d)
+
+        # Check if value is bigger than maximum output.
+        saturated = np.abs(pid) > self.Guard
+        if saturated.any():
+            pid = np.where(saturated, np.where(pid > 0, self.Guard, -self.Guard), pid)
+            # Limit integral while output is at maximum.
+            with np.errstate(divide='ignore', invalid='ignore'):
+                i = np.where(saturated, pid / self.Kp - (p + d), i)
+
+        # Remember last timestamp, error and integral for next calculation.
+        self.last_timestamp = timestamp
+        self.last_error = error
+        self.last_integral = i
+
+        # Return output.
+        return pid
+
+    def run(self, feedback_values, timestamps):
+        """
+        Computes the PID values of every controller for arrays of feedback values and timestamps.
+
+        :return: Array of PID values, shape (samples, controllers).
+        """
+        out = np.empty((len(feedback_values),) + self.Kp.shape)
+        for k in range(len(feedback_values)):
+            out[k] = self.update(float(feedback_values[k]), float(timestamps[k]))
+        return out
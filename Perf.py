@@ -0,0 +1,119 @@
+"""
+Module measures the duration of the stages of the acquisition (GPIB query, graph update, rendering, recording...), to
+find where the time goes. Each stage keeps its last durations in a rolling window, and can be timed from any thread.
+Gauges keep the last value of a quantity (queue depth, missed ticks...). Shown by the diagnostics tab (Diagnostics).
+"""
+import collections
+import contextlib
+import functools
+import threading
+import time
+
+import numpy as np
+
+
+class Stage:
+    """
+    Durations of a stage of the acquisition.
+    """
+
+    def __init__(self, name, size=10000):
+        """
+        :param name: Name of the stage, as 'module.stage'.
+        :param size: Number of durations kept (rolling window).
+        """
+        self.name = name
+        self.durations = collections.deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, duration):
+        """Adds a duration (s)."""
+        self.durations.append(duration)
+        self.count += 1
+        self.total += duration
+
+    def window(self):
+        """Returns the durations in the window (s)."""
+        # Copy first, the deque may be appended by another thread.
+        return np.array(list(self.durations))
+
+    def percentiles(self, q=(50, 99)):
+        """Returns percentiles of the durations in the window, in ms. NaN if empty."""
+        durations = self.window()
+        if not len(durations):
+            return tuple(np.nan for _ in q)
+        return tuple(np.percentile(durations * 1e3, q))
+
+    def maximum(self):
+        """Returns the longest duration in the window, in ms. NaN if empty."""
+        durations = self.window()
+        return durations.max() * 1e3 if len(durations) else np.nan
+
+    def histogram(self, edges=None):
+        """
+        Returns the histogram of the durations in the window.
+
+        :param edges: Bin edges (s). HISTOGRAM_EDGES if None.
+        :return: (counts, edges).
+        """
+        edges = HISTOGRAM_EDGES if edges is None else edges
+        return np.histogram(np.clip(self.window(), edges[0], edges[-1]), edges)
+
+    def clear(self):
+        self.durations.clear()
+        self.count = 0
+        self.total = 0.0
+
+
+# Bins of the histograms, 1 µs to 10 s, 5 per decade.
+HISTOGRAM_EDGES = np.logspace(-6, 1, 36)
+
+# Stages and gauges by name, in order of creation.
+STAGES = collections.OrderedDict()
+GAUGES = collections.OrderedDict()
+_lock = threading.Lock()
+
+
+def stage(name):
+    """Returns the stage with the given name, created if needed."""
+    try:
+        return STAGES[name]
+    except KeyError:
+        with _lock:
+            return STAGES.setdefault(name, Stage(name))
+
+
+@contextlib.contextmanager
+def measure(name):
+    """Times the block as a stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage(name).add(time.perf_counter() - start)
+
+
+def timed(name):
+    """Decorator timing each call of the function as a stage."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stage(name).add(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def gauge(name, value):
+    """Sets the value of a gauge."""
+    GAUGES[name] = value
+
+
+def clear():
+    """Clears the durations of all stages."""
+    for s in list(STAGES.values()):
+        s.clear()
@@ -0,0 +1,232 @@
+"""
+Module renders the live charts incrementally.
+The static part of the figure (axes, ticks, labels) is cached and only the data lines are redrawn on each update.
+Redraws are scheduled at a capped frame rate, independently of the acquisition rate, and the lines are decimated to
+what the axes can show.
+"""
+import numpy as np
+from PyQt5 import QtCore
+
+import Perf
+
+
+class RenderScheduler(QtCore.QObject):
+    """
+    Renders the views with new data at most FPS times per second. Any number of requests between two frames costs
+    a single render, and hidden views (ex: inactive tab) are not rendered until shown.
+    """
+
+    def __init__(self, fps=10):
+        # Initialise overloaded classes.
+        super().__init__()
+
+        # Views as (widget, render function) and widgets with new data.
+        self.views = list()
+        self.dirty = set()
+
+        # Create frame timer.
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.render)
+        self.set_fps(fps)
+        self.timer.start()
+
+    def add(self, widget, render):
+        """
+        Adds a view.
+
+        :param widget: Widget showing the view. Not rendered while hidden.
+        :param render: Function called to render the view.
+        """
+        self.views.append((widget, render))
+
+    def request(self, widget):
+        """Marks the view of the widget to be rendered at the next frame."""
+        self.dirty.add(widget)
+
+    @QtCore.pyqtSlot(float)
+    def set_fps(self, fps):
+        self.timer.setInterval(int(1000 / fps))
+
+    @QtCore.pyqtSlot()
+    def render(self):
+        for widget, render in self.views:
+            # Render only if new data and visible. Hidden views stay marked until shown.
+            if widget in self.dirty and widget.isVisible():
+                self.dirty.discard(widget)
+                render()
+
+
+def decimate(x, y, x0, x1, buckets):
+    """
+    Reduces a line to what is visible between x0 and x1 on a given number of pixel columns (buckets).
+    The minimum and the maximum of each bucket are kept, so peaks are never hidden by the decimation.
+
+    :param x: Increasing x values.
+    :param y: y values.
+    :return: Decimated (x, y). Views of the inputs if there is nothing to decimate.
+    """
+    # Visible part, with one point outside on each side so the line reaches the edges.
+    start = max(np.searchsorted(x, x0, 'left') - 1, 0)
+    stop = min(np.searchsorted(x, x1, 'right') + 1, len(x))
+    x = x[start:stop]
+    y = y[start:stop]
+
+    # Nothing to gain if fewer points than 2 per bucket.
+    if len(x) <= 2 * buckets:
+        return x, y
+
+    # First index of each non-empty bucket.
+    first = np.searchsorted(x, np.linspace(x0, x1, buckets + 1))
+    first = np.unique(np.concatenate(([0], first[first < len(x)])))
+
+    # Min and max of each bucket. (NaN ignored, unless the whole bucket is NaN.)
+    ymin = np.fmin.reduceat(y, first)
+    ymax = np.fmax.reduceat(y, first)
+
+    # Vertical segment at the start of each bucket.
+    return np.repeat(x[first], 2), np.column_stack((ymin, ymax)).ravel()
+
+
+class BlitPlot:
+    """
+    Incremental renderer for a figure with animated lines. The background is cached after every full draw, then each
+    update restores it and blits only the lines. Limits and layout are recomputed (full draw) only when the data leaves
+    the current view.
+    The lines are fed only what is visible, decimated to the width of the axes. Full resolution data is kept by the
+    renderer and decimated again for the new view after each zoom or pan.
+    """
+
+    def __init__(self, canvas, toolbar, lines, margin=0.1):
+        """
+        :param canvas: FigureCanvas showing the figure.
+        :param toolbar: NavigationToolbar of the canvas.
+        :param lines: Line artists updated by the widget.
+        :param margin: Fraction of the data span added to the limits at each rescale, so the view is not rescaled on
+            every new sample.
+        """
+        self.canvas = canvas
+        self.figure = canvas.figure
+        self.toolbar = toolbar
+        self.lines = lines
+        self.margin = margin
+
+        # Axes of the lines, without duplicates.
+        self.axes = list()
+        for line in lines:
+            if line.axes not in self.axes:
+                self.axes.append(line.axes)
+
+        # Animated lines are skipped by the full draw, they are drawn over the cached background.
+        for line in lines:
+            line.set_animated(True)
+
+        # Full resolution data of each line.
+        self.data = dict((line, (np.empty(0), np.empty(0))) for line in lines)
+
+        # Init cached background and last autoscale settings.
+        self.background = None
+        self.autoscale = None
+
+        # Cache background after every full draw (redraw, resize, zoom, pan).
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def set_data(self, line, x, y):
+        """
+        Sets the full resolution data of a line. Shown at next update.
+
+        :param x: Increasing x values.
+        """
+        self.data[line] = (np.asarray(x), np.asarray(y))
+
+    def decimate(self):
+        """
+        Feeds the lines with the data visible in the current limits.
+        """
+        for line in self.lines:
+            x, y = self.data[line]
+            x0, x1 = line.axes.get_xlim()
+            line.set_data(*decimate(x, y, x0, x1, max(int(line.axes.bbox.width), 1)))
+
+    def on_draw(self, event):
+        # Copy the figure without the lines.
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        # Draw the lines over it, decimated for the limits just drawn (they may come from the toolbar).
+        self.decimate()
+        self.draw_lines()
+
+    def draw_lines(self):
+        for line in self.lines:
+            line.axes.draw_artist(line)
+
+    def update(self, autox, autoy):
+        """
+        Shows the new line data. Blits the lines, or redraws the figure if needed.
+        """
+        with Perf.measure('plot.decimate'):
+            self.decimate()
+        if self.background is None or self.autoscale != (autox, autoy) or self.out_of_view(autox, autoy):
+            self.redraw(autox, autoy)
+        else:
+            # Restore background, draw lines and show only that.
+            with Perf.measure('plot.blit'):
+                self.canvas.restore_region(self.background)
+                self.draw_lines()
+                self.canvas.blit(self.figure.bbox)
+
+    def redraw(self, autox, autoy):
+        """
+        Recomputes limits and layout, then draws the whole figure.
+        """
+        self.autoscale = (autox, autoy)
+
+        # Full resolution data, to compute the limits.
+        for line in self.lines:
+            line.set_data(*self.data[line])
+
+        for ax in self.axes:
+            # Update limits.
+            ax.relim()
+            # Autoscale axes.
+            ax.autoscale(enable=autox, axis='x')
+            ax.autoscale(enable=autoy, axis='y')
+
+            # Leave room for the next samples.
+            if autox:
+                x0, x1 = ax.get_xlim()
+                ax.set_xlim(x0, x1 + (x1 - x0) * self.margin, auto=True)
+            if autoy:
+                y0, y1 = ax.get_ylim()
+                ax.set_ylim(y0 - (y1 - y0) * self.margin / 2, y1 + (y1 - y0) * self.margin / 2, auto=True)
+
+        with Perf.measure('plot.layout'):
+            self.figure.tight_layout()
+        # Redraw graph. (Background cached by on_draw.)
+        with Perf.measure('plot.draw'):
+            self.canvas.draw()
+        # Update toolbar home value.
+        self.toolbar.update()
+
+    def out_of_view(self, autox, autoy):
+        """
+        Returns True if the data of an autoscaled axis is outside the current limits.
+        """
+        for line in self.lines:
+            x = self.data[line][0]
+            if not len(x):
+                continue
+
+            # Time is increasing, check only the ends.
+            if autox:
+                x0, x1 = line.axes.get_xlim()
+                if x[0] < x0 or x[-1] > x1:
+                    return True
+
+            # Decimated line keeps the visible minimums and maximums.
+            if autoy:
+                y = np.asarray(line.get_ydata())
+                y = y[np.isfinite(y)]
+                if len(y):
+                    y0, y1 = line.axes.get_ylim()
+                    if y.min() < y0 or y.max() > y1:
+                        return True
+        return False
@@ -2,10 +2,16 @@
 Module controls PHD2000 pump.
 Can be executed as standalone or imported to be used as a widget.
 """
+import collections
+import concurrent.futures
+import re
+
+import numpy as np
 import serial
 from PyQt5 import QtCore, QtWidgets, QtGui
-from serial.tools import list_ports
 
+import Clock
+from Drivers import SerialBackend
 from WidgetPump import Ui_WidgetPump
 from DialogPump import Ui_DialogPump
 
@@ -17,51 +23,68 @@ class WidgetPump(QtWidgets.QWidget, Ui_WidgetPump):
     s_run = QtCore.pyqtSignal()
     s_stp = QtCore.pyqtSignal()
     g_tar = QtCore.pyqtSignal()
+    s_schedule = QtCore.pyqtSignal(list)
+    s_abort = QtCore.pyqtSignal()
 
-    def __init__(self):
+    def __init__(self, backend=None, interval=500):
+        """
+        :param backend: Serial backend of the pump (ex: SimInstruments.SimSerialBackend). SerialBackend if None.
+        :param interval: Time between two polls of the state while infusing (ms).
+        """
         # Initialise overloaded classes.
         super().__init__()
         self.setupUi(self)
 
+        self.backend = backend or SerialBackend()
+
         # Start serial thread.
         self.thread = QtCore.QThread()
-        self.protocol = SerialThread()
+        self.protocol = SerialThread(self.backend, interval)
+        self.schedule = InjectionSchedule(self.protocol)
 
-        # Move object to thread.
+        # Move objects to thread.
         self.protocol.moveToThread(self.thread)
+        self.schedule.moveToThread(self.thread)
 
         # Connect slots and signals.
         self.thread.started.connect(self.protocol.start)
+        self.thread.started.connect(self.schedule.start)
 
         self.protocol.finished.connect(self.thread.quit)
         self.protocol.updateSignal.connect(self.update_status)
         self.protocol.recTarSignal.connect(self.update_target)
+        self.protocol.failed.connect(self.command_failed)
 
         self.open.connect(self.protocol.open)
         self.close.connect(self.protocol.close)
         self.s_run.connect(self.protocol.send_run)
         self.s_stp.connect(self.protocol.send_stp)
         self.g_tar.connect(self.protocol.get_target)
+        self.s_schedule.connect(self.schedule.run)
+        self.s_abort.connect(self.schedule.abort)
+        self.protocol.updateSignal.connect(self.schedule.update_state)
+        self.schedule.finished.connect(self.schedule_finished)
         self.connect_status.setPixmap(QtGui.QPixmap(".\\ico\\WX_circle_red.png"))
 
         # Start thread.
         self.thread.start()
 
         # List ports.
-        for t in list_ports.comports():
-            self.combo_port.addItem(t.device)
+        self.combo_port.addItems(self.backend.ports())
 
         # Connect interface slots.
         self.btn_conn.clicked.connect(self.connect)
         self.btn_config.clicked.connect(self.config)
         self.btn_infuse.clicked.connect(self.button_action)
-
-        # Update GUI.
-        self.update_status(SerialThread.DISCONNECTED)
+        self.btn_schedule.clicked.connect(self.run_schedule)
 
         # Set initial state.
         self.connected = False
         self.state = SerialThread.DISCONNECTED
+        self.scheduled = False
+
+        # Update GUI.
+        self.update_status(SerialThread.DISCONNECTED)
 
     # Open or close serial port.
     @QtCore.pyqtSlot()
@@ -96,6 +119,44 @@ class WidgetPump(QtWidgets.QWidget, Ui_WidgetPump):
         elif self.state == SerialThread.FORWARD:
             self.s_stp.emit()
 
+    @QtCore.pyqtSlot()
+    def run_schedule(self):
+        """
+        Runs the injections of a schedule file, or stops the schedule running.
+        The file has one injection per line: volume (µl), rate (µl/min), delay before the injection (s), separated by
+        commas. Lines starting with # are comments.
+        """
+        if self.scheduled:
+            self.s_abort.emit()
+            return
+
+        filename = QtWidgets.QFileDialog.getOpenFileName(self, 'Injection schedule', '',
+                                                         'CSV files (*.csv);;All files (*)')[0]
+        if filename == '':
+            return
+        try:
+            steps = np.loadtxt(filename, delimiter=',', comments='#', ndmin=2)
+        except (IOError, ValueError) as e:
+            QtWidgets.QMessageBox.critical(self, 'Error', str(e))
+            return
+        if steps.shape[1] != 3 or np.any(steps[:, :2] <= 0) or np.any(steps[:, 2] < 0):
+            QtWidgets.QMessageBox.critical(self, 'Error', 'Each line must be volume (µl) > 0, rate (µl/min) > 0, '
+                                                          'delay (s) >= 0.')
+            return
+
+        self.scheduled = True
+        self.btn_schedule.setText('Stop schedule')
+        self.update_status(self.state)
+        self.s_schedule.emit([tuple(step) for step in steps.tolist()])
+
+    @QtCore.pyqtSlot(bool)
+    def schedule_finished(self, done):
+        self.scheduled = False
+        self.btn_schedule.setText('Run schedule...')
+        self.update_status(self.state)
+        if not done:
+            QtWidgets.QMessageBox.warning(self, 'Warning', 'Injection schedule stopped before its end.')
+
     # Slot to receive target and update label.
     @QtCore.pyqtSlot(float)
     def update_target(self, tar):
@@ -104,6 +165,11 @@ class WidgetPump(QtWidgets.QWidget, Ui_WidgetPump):
         else:        # Otherwise, show in ml.
             self.lbl_target.setText('{:0.5} ml'.format(tar))
 
+    # Slot to show the last failed command in the tooltip of the state.
+    @QtCore.pyqtSlot(str)
+    def command_failed(self, message):
+        self.lbl_state.setToolTip(message)
+
     # Update GUI with state.
     @QtCore.pyqtSlot(int)
     def update_status(self, status):
@@ -116,9 +182,10 @@ class WidgetPump(QtWidgets.QWidget, Ui_WidgetPump):
         self.combo_port.setEnabled(not status)
         self.combo_baud.setEnabled(not status)
 
-        # Enable configuration and infusion when connected.
-        self.btn_config.setEnabled(status)
-        self.btn_infuse.setEnabled(status)
+        # Enable configuration and infusion when connected, and not running a schedule.
+        self.btn_config.setEnabled(status and not self.scheduled)
+        self.btn_infuse.setEnabled(status and not self.scheduled)
+        self.btn_schedule.setEnabled(status)
 
         # Update status label, status icon and action button text.
         if status == SerialThread.DISCONNECTED:
@@ -193,6 +260,10 @@ class DialogPump(QtWidgets.QDialog, Ui_DialogPump):
 class SerialThread(QtCore.QObject):
     """
     Thread class. Used to control the serial port communicating with the pump.
+    Commands are queued (submit) and sent one at a time, the next one as soon as the prompt of the previous one is
+    received. The answers are received by a SerialReader thread: each command is answered by a prompt giving the
+    state of the pump, after its data if any. A command not answered in time is sent again, then fails.
+    While infusing, the state is polled with an empty command every interval.
     """
 
     finished = QtCore.pyqtSignal()
@@ -200,6 +271,7 @@ class SerialThread(QtCore.QObject):
     recRatSignal = QtCore.pyqtSignal([float, int])
     recDiaSignal = QtCore.pyqtSignal([float])
     recTarSignal = QtCore.pyqtSignal([float])
+    failed = QtCore.pyqtSignal(str)
 
     # SerialThread possible states.
     DISCONNECTED = 0
@@ -207,13 +279,60 @@ class SerialThread(QtCore.QObject):
     FORWARD = 2
     STALLED = 3
 
+    # Kinds of answers.
+    NONE = 0
+    DIAMETER = 1
+    RATE = 2
+    TARGET = 3
+    DELIVERED = 4
+
+    # Time to wait for the answer of a command (ms), and number of times it is sent again if not answered.
+    TIMEOUT = 1000
+    RETRIES = 2
+
+    def __init__(self, backend=None, interval=500):
+        """
+        :param backend: Object creating the serial port. SerialBackend if None.
+        :param interval: Time between two polls of the state while infusing (ms).
+        """
+        # Initialise overloaded classes.
+        super().__init__()
+
+        self.backend = backend or SerialBackend()
+        self.interval = interval
+
     @QtCore.pyqtSlot()
     def start(self):
-        # Init serial port (not opened).
-        self.ser = serial.Serial(parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_TWO)
+        # Init serial port (not opened). Reads return at least every reader timeout.
+        self.ser = self.backend.serial()
+        self.ser.timeout = SerialReader.TIMEOUT
+        self.reader = None
+        self.reader_thread = None
+
+        # Commands queued, command waiting for its answer and parser of the received bytes.
+        self.queue = collections.deque()
+        self.current = None
+        self.parser = AnswerParser()
+        # Answers still expected: a command sent again may be answered twice.
+        self.outstanding = 0
+        self.state = SerialThread.DISCONNECTED
+        # Times (Clock) of the last command written and of the last answer received.
+        self.sent = None
+        self.timestamp = None
+
+        # Timeout of the current command.
+        self.watchdog = QtCore.QTimer(self)
+        self.watchdog.setSingleShot(True)
+        self.watchdog.timeout.connect(self.expire)
+
+        # Status poll timer, running while infusing.
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(self.interval)
+        self.timer.timeout.connect(self.poll)
 
     @QtCore.pyqtSlot()
     def stop(self):
+        self.close()
         self.finished.emit()
 
     @QtCore.pyqtSlot(str, str)
@@ -224,140 +343,509 @@ class SerialThread(QtCore.QObject):
 
         # Open serial port.
         self.ser.open()
+        self.parser.clear()
+        self.outstanding = 0
+
+        # Start reader thread.
+        self.reader_thread = QtCore.QThread()
+        self.reader = SerialReader(self.ser)
+        self.reader.moveToThread(self.reader_thread)
+        self.reader_thread.started.connect(self.reader.run)
+        self.reader.finished.connect(self.reader_thread.quit)
+        self.reader.received.connect(self.receive)
+        self.reader_thread.start()
 
         # Change state.
-        self.updateSignal.emit(SerialThread.STOPPED)
+        self.update_state(SerialThread.STOPPED)
 
     @QtCore.pyqtSlot()
     def close(self):
+        self.timer.stop()
+
+        # Stop reader thread, within a read timeout.
+        if self.reader is not None:
+            self.reader.stop()
+            self.reader_thread.quit()
+            self.reader_thread.wait()
+            self.reader = None
+            self.reader_thread = None
+
         # Close serial port.
         self.ser.close()
 
+        # Fail the commands not answered.
+        self.watchdog.stop()
+        self.outstanding = 0
+        commands = ([self.current] if self.current is not None else []) + list(self.queue)
+        self.current = None
+        self.queue.clear()
+        for command in commands:
+            command.future.set_exception(IOError('Port closed'))
+
         # Change state.
-        self.updateSignal.emit(SerialThread.DISCONNECTED)
+        self.update_state(SerialThread.DISCONNECTED)
+
+    def submit(self, command, kind=NONE, timeout=None, retries=None):
+        """
+        Queues a command to the pump. Must be called from the thread of the worker (ex: from its slots or from the
+        callbacks of the futures).
+
+        :param command: Command, without the carriage return.
+        :param kind: Kind of answer expected.
+        :param timeout: Time to wait for the answer (ms). TIMEOUT if None.
+        :param retries: Number of times the command is sent again if not answered. RETRIES if None.
+        :return: concurrent.futures.Future of the answer: value of the data (see decode_answer), None if no data.
+        """
+        command = PumpCommand(command, kind, self.TIMEOUT if timeout is None else timeout,
+                              self.RETRIES if retries is None else retries)
+        if not self.ser.is_open:
+            command.future.set_exception(IOError('Port not open'))
+        else:
+            self.queue.append(command)
+            self.send_next()
+        return command.future
+
+    def send_next(self):
+        # Send the next command if the previous one is answered.
+        if self.current is None and self.queue:
+            self.current = self.queue.popleft()
+            self.write(self.current)
+
+    def write(self, command):
+        try:
+            self.ser.write(command.command + b'\r')
+        except (IOError, serial.SerialException) as err:
+            self.finish(exception=err)
+            return
+        self.sent = Clock.now()
+        self.outstanding += 1
+        self.watchdog.start(command.timeout)
 
-    """ Infuse and stop commands """
     @QtCore.pyqtSlot()
-    def send_run(self):
+    def expire(self):
+        """
+        Slot called when the current command is not answered in time. Sends it again, or fails it.
+        Also called when the extra answers of a command sent again are not received: they were lost.
+        """
+        if self.current is None:
+            self.outstanding = 0
+            self.parser.clear()
+            self.send_next()
+            return
+        if self.current.retries > 0:
+            self.current.retries -= 1
+            # Drop the partial answer.
+            self.parser.clear()
+            self.write(self.current)
+        else:
+            self.finish(exception=TimeoutError('No answer from the pump to {}'.format(self.current.name())))
+
+    def finish(self, value=None, exception=None):
         """
-        Sends run command and updates status until pump has stopped.
+        Sets the answer of the current command, and sends the next one.
         """
-        self.ser.write(b'RUN\r')
-        over = False
+        command, self.current = self.current, None
+        self.watchdog.stop()
+        if exception is None:
+            if command.kind == SerialThread.DIAMETER:
+                self.recDiaSignal.emit(value)
+            elif command.kind == SerialThread.RATE:
+                self.recRatSignal.emit(*value)
+            elif command.kind == SerialThread.TARGET:
+                self.recTarSignal.emit(value)
+            command.future.set_result(value)
+        else:
+            print(exception)
+            self.failed.emit(str(exception))
+            command.future.set_exception(exception)
+        if self.outstanding > 0:
+            # Sent more than once. Wait for the other answers, so they do not answer the next command.
+            self.watchdog.start(command.timeout)
+        else:
+            self.send_next()
 
-        while not over and self.ser.is_open:
-            # Send carriage return to receive status.
-            self.ser.write(b'\r')
-            in_packet = True
+    """ Infuse and stop commands """
+    @QtCore.pyqtSlot()
+    def send_run(self):
+        self.infuse()
 
-            while in_packet and self.ser.is_open:
-                # Read all that is there.
-                data = self.ser.read(self.ser.in_waiting or 1)
+    def infuse(self):
+        """
+        Sends run command. The state is polled until the pump has stopped.
+
+        :return: Future of the answer.
+        """
+        future = self.submit(b'RUN')
+        future.add_done_callback(self.started)
+        return future
 
-                # For each byte.
-                for byte in serial.iterbytes(data):
-                    if byte == b':':
-                        self.updateSignal.emit(SerialThread.STOPPED)
-                        over = True
-                        in_packet = False
-                    elif byte == b'>':
-                        self.updateSignal.emit(SerialThread.FORWARD)
-                        in_packet = False
-                    elif byte == b'*':
-                        self.updateSignal.emit(SerialThread.STALLED)
-                        over = True
-                        in_packet = False
-
-            # Check if signals require processing.
-            QtWidgets.QApplication.processEvents()
+    def started(self, future):
+        # Poll while infusing.
+        if future.exception() is None and self.state == SerialThread.FORWARD:
+            self.timer.start()
 
     @QtCore.pyqtSlot()
     def send_stp(self):
-        self.ser.write(b'STP\r')
+        self.submit(b'STP')
+
+    @QtCore.pyqtSlot()
+    def poll(self):
+        # Empty command to receive the state, unless commands are already pending. Not sent again, next poll will.
+        if self.ser.is_open and self.current is None and not self.queue:
+            self.submit(b'', retries=0)
 
     """ Send config commands """
     @QtCore.pyqtSlot(float)
     def send_diameter(self, diameter):
-        self.ser.reset_input_buffer()
-        self.ser.write('MMD{0:.05}\r'.format(diameter).encode('ascii'))
-        self.get_answer(4)  # Wait for answer from the pump.
+        self.submit('MMD{0:.05}'.format(diameter).encode('ascii'))
 
     @QtCore.pyqtSlot(float, int)
     def send_rate(self, rate, unit):
-        self.ser.reset_input_buffer()
-        self.ser.write('{1}{0:.05}\r'.format(rate, ('MLM', 'ULM', 'MLH', 'ULH')[unit]).encode('ascii'))
-        self.get_answer(4)  # Wait for answer from the pump.
+        self.submit('{1}{0:.05}'.format(rate, ('MLM', 'ULM', 'MLH', 'ULH')[unit]).encode('ascii'))
 
     @QtCore.pyqtSlot(float)
     def send_target(self, target):
-        self.ser.reset_input_buffer()
-        self.ser.write('MLT{0:.05}\r'.format(target).encode('ascii'))
-        self.get_answer(4)  # Wait for answer from the pump.
+        self.submit('MLT{0:.05}'.format(target).encode('ascii'))
 
     """ Get config commands """
     @QtCore.pyqtSlot()
     def get_diameter(self):
-        self.ser.reset_input_buffer()   # Clear input buffer.
-        self.ser.write(b'DIA\r')        # Send request.
-        self.get_answer(1)              # Wait for answer from the pump.
+        self.submit(b'DIA', SerialThread.DIAMETER)
 
     @QtCore.pyqtSlot()
     def get_rate(self):
-        self.ser.reset_input_buffer()   # Clear input buffer.
-        self.ser.write(b'RAT\r')        # Send request.
-        self.get_answer(2)              # Wait for answer from the pump.
+        self.submit(b'RAT', SerialThread.RATE)
 
     @QtCore.pyqtSlot()
     def get_target(self):
-        self.ser.reset_input_buffer()   # Clear input buffer.
-        self.ser.write(b'TAR\r')        # Send request.
-        self.get_answer(3)              # Wait for answer from the pump.
-
-    def get_answer(self, requested):
-        """
-        Function reads the bytes until the requested answer is given.
-        
-        :param requested: Kind of answer to expect.
-            1 = Diameter
-            2 = Rate
-            3 = Target
-        """
-        # Init variables.
-        packet = bytearray()
-        in_packet = False
-
-        # Thread loop. While connected.
-        while self.ser.is_open and (requested or in_packet):
-            # Read all that is there.
-            data = self.ser.read(self.ser.in_waiting or 1)
-
-            # For each byte.
-            for byte in serial.iterbytes(data):
-                if byte == b'\n':
-                    in_packet = True
-                    del packet[:]
-                elif byte == b':':
-                    self.updateSignal.emit(SerialThread.STOPPED)
-                    in_packet = False
-                    requested = 0
-                elif byte == b'>':
-                    self.updateSignal.emit(SerialThread.FORWARD)
-                    in_packet = False
-                    requested = 0
-                elif byte == b'*':
-                    self.updateSignal.emit(SerialThread.STALLED)
-                    in_packet = False
-                    requested = 0
-                elif byte == b'\r':
-                    if requested == 1:
-                        self.recDiaSignal.emit(float(bytes(packet)))
-                    elif requested == 2:
-                        self.recRatSignal.emit(float(packet[:8]),
-                                               [b'ml/mn', b'ul/mn', b'ml/hr', b'ul/hr'].index(bytes(packet[9:])))
-                    elif requested == 3:
-                        self.recTarSignal.emit(float(bytes(packet)))
-                elif in_packet:
-                    packet.extend(byte)
+        self.submit(b'TAR', SerialThread.TARGET)
+
+    @QtCore.pyqtSlot(bytes, float)
+    def receive(self, data, timestamp):
+        """
+        Slot called with the bytes received by the reader. Sends the state of the pump and answers the current
+        command.
+
+        :param data: Bytes received.
+        :param timestamp: Time the bytes were read (Clock).
+        """
+        self.timestamp = timestamp
+        for answer in self.parser.feed(data):
+            self.update_state(answer.state)
+            self.outstanding = max(self.outstanding - 1, 0)
+            if self.current is None:
+                # Extra answer of a command sent again, discarded. Next command once all are received.
+                if self.outstanding == 0 and self.watchdog.isActive():
+                    self.watchdog.stop()
+                    self.send_next()
+                continue
+            value = None
+            exception = None
+            if self.current.kind != SerialThread.NONE:
+                try:
+                    value = decode_answer(self.current.kind, answer.data)
+                except ValueError as err:
+                    exception = err
+            elif answer.data is not None:
+                # Commands without data are answered with data when rejected ('?', 'OOR').
+                exception = ValueError('Pump answered {} to {}'.format(answer.data.decode('ascii', 'replace'),
+                                                                       self.current.name()))
+            self.finish(value, exception)
+
+    def update_state(self, state):
+        # Stop polling once the pump has stopped.
+        self.state = state
+        if state != SerialThread.FORWARD:
+            self.timer.stop()
+        self.updateSignal.emit(state)
+
+
+class InjectionSchedule(QtCore.QObject):
+    """
+    Thread class. Runs a list of injections on the pump, in the thread of the SerialThread, through its command queue.
+    Each step waits its delay, then infuses its volume at its rate (target volume, cleared before each injection).
+    The delivered volume is polled while infusing. The start and the end of each injection are sent with their time:
+    the start when the run command was written, the end when the stopped pump answered. The end is also sent with
+    the time the target volume should have been reached at (the state is only known when polled).
+    """
+
+    # Step (from 0), True at the start and False at the end of its injection, time measured (Clock), nominal time
+    # (the start, or the start plus the time to infuse the volume).
+    injection = QtCore.pyqtSignal(int, bool, float, float)
+    # Volume delivered by the current injection (ml).
+    delivered = QtCore.pyqtSignal(float)
+    # True if all the steps were run.
+    finished = QtCore.pyqtSignal(bool)
+
+    # Time between two polls of the delivered volume while infusing (ms).
+    INTERVAL = 1000
+    # Time between two polls of the state from the expected end of an injection until it ends (ms).
+    END_INTERVAL = 50
+
+    def __init__(self, protocol):
+        """
+        :param protocol: SerialThread of the pump, in the same thread.
+        """
+        # Initialise overloaded classes.
+        super().__init__()
+
+        self.protocol = protocol
+
+    @QtCore.pyqtSlot()
+    def start(self):
+        # Init steps.
+        self.steps = list()
+        self.step = -1
+        self.running = False
+        # Commands of the injection sent and not answered yet, pump infusing.
+        self.commands = list()
+        self.pending = False
+        self.infusing = False
+
+        # Delay before the next injection, and poll of the delivered volume.
+        self.delay = QtCore.QTimer(self)
+        self.delay.setSingleShot(True)
+        self.delay.timeout.connect(self.inject)
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(self.INTERVAL)
+        self.timer.timeout.connect(self.poll)
+        # State polled from the expected end of the injection, to see the end without waiting for the next poll.
+        self.end = QtCore.QTimer(self)
+        self.end.setTimerType(QtCore.Qt.PreciseTimer)
+        self.end.timeout.connect(self.poll_end)
+
+    @QtCore.pyqtSlot(list)
+    def run(self, steps):
+        """
+        Runs the injections.
+
+        :param steps: List of (volume (µl), rate (µl/min), delay before the injection (s)).
+        """
+        self.steps = list(steps)
+        self.step = -1
+        self.running = True
+        self.next()
+
+    @QtCore.pyqtSlot()
+    def abort(self):
+        """
+        Stops the schedule. Stops the pump if infusing.
+        """
+        if not self.running:
+            return
+        self.running = False
+        self.delay.stop()
+        if self.infusing:
+            # Ended when the pump has stopped.
+            self.protocol.submit(b'STP')
+        elif not self.pending:
+            self.finished.emit(False)
+
+    def next(self):
+        # Wait for the delay of the next step, or end.
+        self.step += 1
+        if self.step >= len(self.steps):
+            self.running = False
+            self.finished.emit(True)
+        else:
+            self.delay.start(int(self.steps[self.step][2] * 1000))
+
+    @QtCore.pyqtSlot()
+    def inject(self):
+        volume, rate, _ = self.steps[self.step]
+        self.commands = [self.protocol.submit('ULM{0:.05}'.format(rate).encode('ascii')),
+                         self.protocol.submit('MLT{0:.05}'.format(volume / 1000).encode('ascii')),
+                         self.protocol.submit(b'CLD')]
+        self.commands.append(self.protocol.infuse())
+        self.pending = True
+        self.started_at = None
+        self.commands[-1].add_done_callback(self.started)
+
+    def started(self, future):
+        # Run command just answered, not followed by another write yet.
+        self.started_at = self.protocol.sent
+        self.pending = False
+        failed = any(command.exception() is not None for command in self.commands)
+        if self.protocol.state != SerialThread.FORWARD:
+            # Not infusing.
+            self.running = False
+            self.finished.emit(False)
+            return
+
+        self.infusing = True
+        self.injection.emit(self.step, True, self.started_at, self.started_at)
+        self.timer.start()
+        volume, rate, _ = self.steps[self.step]
+        self.end.start(int(volume / rate * 60000))
+        if failed or not self.running:
+            # Rate or target not set, or aborted meanwhile. Ended when the pump has stopped.
+            self.running = False
+            self.protocol.submit(b'STP')
+
+    @QtCore.pyqtSlot()
+    def poll(self):
+        # Not sent again, next poll will.
+        self.protocol.submit(b'DEL', SerialThread.DELIVERED, retries=0).add_done_callback(self.received)
+
+    @QtCore.pyqtSlot()
+    def poll_end(self):
+        self.end.start(self.END_INTERVAL)
+        self.protocol.poll()
+
+    def received(self, future):
+        if future.exception() is None:
+            self.delivered.emit(future.result())
+
+    @QtCore.pyqtSlot(int)
+    def update_state(self, state):
+        """
+        Slot called when the state of the pump is received. Ends the injection when the pump stops.
+        """
+        if not self.infusing or state == SerialThread.FORWARD:
+            return
+        self.infusing = False
+        self.timer.stop()
+        self.end.stop()
+        ended_at = Clock.now() if state == SerialThread.DISCONNECTED else self.protocol.timestamp
+        volume, rate, _ = self.steps[self.step]
+        self.injection.emit(self.step, False, ended_at, self.started_at + volume / rate * 60)
+        if state != SerialThread.DISCONNECTED:
+            # Volume delivered by the whole injection.
+            self.poll()
+        if not self.running:
+            # Aborted.
+            self.finished.emit(False)
+        elif state == SerialThread.STOPPED:
+            self.next()
+        else:
+            # Stalled or disconnected.
+            self.running = False
+            self.finished.emit(False)
+
+
+class PumpCommand:
+    """
+    Command queued to the pump, with its timeout and the number of retries left. The answer is set to the future.
+    """
+
+    def __init__(self, command, kind, timeout, retries):
+        """
+        :param command: Command, without the carriage return.
+        :param kind: Kind of answer expected (SerialThread.NONE, DIAMETER...).
+        :param timeout: Time to wait for the answer (ms).
+        :param retries: Number of times the command is sent again if not answered.
+        """
+        self.command = command
+        self.kind = kind
+        self.timeout = timeout
+        self.retries = retries
+        self.future = concurrent.futures.Future()
+
+    def name(self):
+        """Returns the command as text, for the messages."""
+        return self.command.decode('ascii', 'replace') or 'status request'
+
+
+class SerialReader(QtCore.QObject):
+    """
+    Thread class. Reads the serial port with blocking reads and sends the bytes as they are received.
+    """
+
+    finished = QtCore.pyqtSignal()
+    # Bytes, time they were read (Clock).
+    received = QtCore.pyqtSignal(bytes, float)
+
+    # Longest blocking read (s). The thread checks if it must stop between two reads.
+    TIMEOUT = 0.1
+
+    def __init__(self, ser):
+        """
+        :param ser: Opened serial port, with a read timeout.
+        """
+        # Initialise overloaded classes.
+        super().__init__()
+
+        self.ser = ser
+        self.running = True
+
+    @QtCore.pyqtSlot()
+    def run(self):
+        while self.running and self.ser.is_open:
+            try:
+                # Wait for at least a byte, then read all that is there.
+                data = self.ser.read(self.ser.in_waiting or 1)
+            except (IOError, serial.SerialException) as err:
+                print(err)
+                break
+            if data:
+                self.received.emit(data, Clock.now())
+        self.finished.emit()
+
+    def stop(self):
+        """
+        Stops reading after the current read. Can be called from any thread.
+        """
+        self.running = False
+
+
+# Answer of the pump: data (bytes, None if the command has no data) and state given by the prompt.
+Answer = collections.namedtuple('Answer', ('data', 'state'))
+
+
+class AnswerParser:
+    """
+    Incremental parser of the answers of the PHD2000. Bytes are fed as received, in chunks of any size, and complete
+    answers are returned. An answer is LF, data and CR if any, then LF and the prompt: ':' stopped, '>' infusing or
+    '*' stalled.
+    """
+
+    # Answer, optional data then prompt. Bytes before an answer are skipped.
+    FRAME = re.compile(rb'(?:\n([^\r\n]*)\r)?\n?([:>*])')
+    PROMPTS = {b':': SerialThread.STOPPED, b'>': SerialThread.FORWARD, b'*': SerialThread.STALLED}
+
+    def __init__(self):
+        # Bytes received after the last complete answer.
+        self.buffer = bytearray()
+
+    def clear(self):
+        del self.buffer[:]
+
+    def feed(self, data):
+        """
+        Adds received bytes.
+
+        :return: List of the answers completed, as Answer.
+        """
+        self.buffer.extend(data)
+        answers = list()
+        end = 0
+        for match in self.FRAME.finditer(self.buffer):
+            answers.append(Answer(match.group(1), self.PROMPTS[match.group(2)]))
+            end = match.end()
+        del self.buffer[:end]
+        return answers
+
+
+# Units of the rate answers, in the order of the rate commands.
+RATE_UNITS = ('ml/mn', 'ul/mn', 'ml/hr', 'ul/hr')
+
+
+def decode_answer(kind, data):
+    """
+    Returns the value of the data of an answer.
+
+    :param kind: Kind of answer (SerialThread.DIAMETER, RATE, TARGET...).
+    :param data: Data of the answer (bytes).
+    :return: Float, or (rate, units index) for a rate.
+    :raises ValueError: If no data or invalid data (ex: '?' for an unknown command).
+    """
+    if data is None:
+        raise ValueError('No data in the answer of the pump')
+    text = bytes(data).decode('ascii', 'replace').strip()
+    if kind == SerialThread.RATE:
+        value, units = text.split()
+        return float(value), RATE_UNITS.index(units)
+    return float(text)
 
 
 if __name__ == "__main__":
@@ -365,12 +853,13 @@ if __name__ == "__main__":
     Main to run Pump in standalone.
     """
     import sys
+    from Drivers import serial_backend
 
     # Define app.
     app = QtWidgets.QApplication(sys.argv)
 
-    # Create pump widget.
-    wid = WidgetPump()
+    # Create pump widget. Simulated pump with --simulate.
+    wid = WidgetPump(serial_backend('--simulate' in sys.argv))
 
     # Show window.
     wid.show()
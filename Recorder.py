@@ -0,0 +1,268 @@
+"""
+Module records the acquisition to disk from a background thread.
+The acquisition only queues rows, formatting and disk access never stall it.
+Rows can be recorded as text (CSV) or binary (HDF5 or NumPy) files.
+"""
+import json
+import os
+import queue
+import time
+
+import numpy as np
+from PyQt5 import QtCore
+
+import Perf
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+# File dialog filter of the supported formats.
+FILE_FILTER = 'CSV files (*.csv);;HDF5 files (*.h5);;NumPy files (*.npy)'
+# Formats of the first columns of the nVoltmeter CSV file: time and nVolt as is.
+CSV_FORMATS = ('{}', '{}')
+
+
+def open_sink(filename, formats=CSV_FORMATS):
+    """
+    Returns the sink for the file, based on its extension.
+
+    :param formats: Formats of the first columns of a CSV file (see CSVSink).
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in ('.h5', '.hdf5'):
+        return HDF5Sink(filename)
+    elif ext == '.npy':
+        return NpySink(filename)
+    else:
+        return CSVSink(filename, formats)
+
+
+class CSVSink:
+    """
+    Writes rows to a text CSV file. First two lines are the names and the units of the columns.
+    """
+
+    def __init__(self, filename, formats=CSV_FORMATS):
+        """
+        :param formats: Formats of the first columns, the others with 6 decimals.
+        """
+        self.file = open(filename, mode='w+t')
+        self.formats = list(formats)
+        self.fmt = None
+
+    def header(self, names, units):
+        self.file.write(', '.join(names) + '\n')
+        self.file.write(', '.join(units) + '\n')
+
+    def write(self, block):
+        # Formats of the first columns, values of the others with 6 decimals.
+        if self.fmt is None:
+            formats = (self.formats + ['{:f}'] * block.shape[1])[:block.shape[1]]
+            self.fmt = ', '.join(formats) + '\n'
+        # Format the whole block at once.
+        self.file.write((self.fmt * len(block)).format(*block.ravel().tolist()))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        # Make sure everything is on disk.
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+
+class HDF5Sink:
+    """
+    Writes rows to a chunked and compressed HDF5 dataset named 'data'. Names and units of the columns are attributes
+    of the dataset. Requires h5py.
+    """
+
+    def __init__(self, filename, chunk_rows=4096, compression='gzip'):
+        if h5py is None:
+            raise IOError(0, 'h5py is required to record HDF5 files')
+        self.file = h5py.File(filename, 'w')
+        self.chunk_rows = chunk_rows
+        self.compression = compression
+        self.dataset = None
+        self.names = list()
+        self.units = list()
+
+    def header(self, names, units):
+        self.names = names
+        self.units = units
+
+    def write(self, block):
+        # Create resizable dataset with the first rows.
+        if self.dataset is None:
+            self.dataset = self.file.create_dataset('data', shape=(0, block.shape[1]), maxshape=(None, block.shape[1]),
+                                                    dtype='f8', chunks=(self.chunk_rows, block.shape[1]),
+                                                    compression=self.compression, shuffle=True)
+            self.dataset.attrs['names'] = json.dumps(self.names)
+            self.dataset.attrs['units'] = json.dumps(self.units)
+
+        # Append rows.
+        n = self.dataset.shape[0]
+        self.dataset.resize(n + len(block), axis=0)
+        self.dataset[n:] = block
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class NpySink:
+    """
+    Writes rows to an appendable .npy file, readable with numpy.load(filename, mmap_mode='r') even while recording.
+    Names and units of the columns are in a JSON file with the same name.
+    The header has a fixed size, the number of rows is updated in place at every flush.
+    """
+
+    # Size of the .npy header (magic, version, length and padded dictionary).
+    HEADER_SIZE = 128
+
+    def __init__(self, filename):
+        self.file = open(filename, mode='w+b')
+        self.json = os.path.splitext(filename)[0] + '.json'
+        self.rows = 0
+        self.columns = None
+
+    def header(self, names, units):
+        with open(self.json, mode='w') as f:
+            json.dump({'names': names, 'units': units}, f)
+
+    def write_header(self):
+        header = "{{'descr': '<f8', 'fortran_order': False, 'shape': ({}, {}), }}".format(self.rows, self.columns)
+        header = header.ljust(self.HEADER_SIZE - 11) + '\n'
+        self.file.seek(0)
+        self.file.write(np.lib.format.magic(1, 0) + np.uint16(len(header)).astype('<u2').tobytes() +
+                        header.encode('latin1'))
+        self.file.seek(0, 2)
+
+    def write(self, block):
+        # Reserve header with the first rows.
+        if self.columns is None:
+            self.columns = block.shape[1]
+            self.write_header()
+        self.file.write(block.astype('<f8').tobytes())
+        self.rows += len(block)
+
+    def flush(self):
+        # Update number of rows.
+        if self.columns is not None:
+            self.write_header()
+        self.file.flush()
+
+    def close(self):
+        # Make sure everything is on disk.
+        self.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+
+class RecordWriter(QtCore.QThread):
+    """
+    Thread writing the recorded rows to a sink (CSVSink, HDF5Sink or NpySink). Rows are queued in blocks by the acquisition, then
+    written and flushed by this thread when enough rows are pending or enough time elapsed.
+    """
+
+    error = QtCore.pyqtSignal(str)
+
+    # Writers stopped without waiting, kept until their thread has finished.
+    closing = set()
+
+    def __init__(self, sink, flush_interval=1.0, flush_rows=1000, maxsize=10000, name='record'):
+        """
+        :param sink: Object with header, write, flush and close methods.
+        :param flush_interval: Maximum time (s) rows wait before being written.
+        :param flush_rows: Number of pending rows that triggers a write.
+        :param maxsize: Maximum number of blocks in the queue. If full, the blocks are dropped, not to stall the
+            acquisition. The header and the stop request are always queued.
+        :param name: Name of the writer in the diagnostics (stage name.write, gauges name.queue and name.dropped).
+        """
+        # Initialise overloaded classes.
+        super().__init__()
+
+        self.sink = sink
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        # Not bounded, so the header and the stop request never block. Rows are bounded by write.
+        self.queue = queue.Queue()
+        self.maxsize = maxsize
+        self.name = name
+        self.dropped = 0
+
+    def header(self, names, units):
+        """Queues the header. Must be called before the first rows."""
+        self.queue.put_nowait(('header', (names, units)))
+
+    def write(self, block):
+        """
+        Queues rows.
+
+        :param block: Array of shape (rows, columns).
+        """
+        # Rows are dropped if the thread stopped on an error, or if it does not keep up.
+        if self.isRunning():
+            if self.queue.qsize() < self.maxsize:
+                self.queue.put_nowait(('rows', np.array(block, dtype=float, ndmin=2)))
+            else:
+                self.dropped += 1
+                Perf.gauge(self.name + '.dropped', self.dropped)
+            Perf.gauge(self.name + '.queue', self.queue.qsize())
+
+    def stop(self, wait=True):
+        """
+        Writes the pending rows and closes the sink.
+
+        :param wait: Wait for the thread to finish. If False, returns at once, the writer is kept until it finishes.
+        """
+        if self.isRunning():
+            if not wait:
+                RecordWriter.closing.add(self)
+                self.finished.connect(lambda: RecordWriter.closing.discard(self))
+            self.queue.put_nowait(('stop', None))
+            if not wait:
+                return
+        self.wait()
+
+    def run(self):
+        pending = list()
+        count = 0
+        last = time.monotonic()
+        running = True
+
+        try:
+            while running:
+                # Wait for rows, up to the next flush.
+                try:
+                    kind, item = self.queue.get(timeout=max(self.flush_interval - (time.monotonic() - last), 0))
+                except queue.Empty:
+                    kind, item = None, None
+
+                if kind == 'stop':
+                    running = False
+                elif kind == 'header':
+                    self.sink.header(*item)
+                elif kind == 'rows':
+                    pending.append(item)
+                    count += len(item)
+
+                # Write pending rows as one block.
+                if not running or count >= self.flush_rows or time.monotonic() - last >= self.flush_interval:
+                    if pending:
+                        with Perf.measure(self.name + '.write'):
+                            self.sink.write(np.concatenate(pending))
+                            self.sink.flush()
+                        pending.clear()
+                        count = 0
+                        Perf.gauge(self.name + '.queue', self.queue.qsize())
+                    last = time.monotonic()
+        except Exception as err:
+            self.error.emit(str(err))
+        finally:
+            self.sink.close()
@@ -0,0 +1,119 @@
+"""
+Module stores the plotted time series in fixed size NumPy buffers.
+Memory and per-sample cost stay constant, whatever the length of the run.
+"""
+import tempfile
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed capacity ring buffer of rows with one float column per series (ex: time, value).
+    Every row is written twice, at i and i + capacity, so the stored rows are always available in order as a
+    contiguous view of each column, without any copy.
+    Rows pushed out of the buffer can be spilled to a binary file to keep the full history of the run.
+    """
+
+    def __init__(self, capacity, columns, spill=None):
+        """
+        :param capacity: Maximum number of rows kept in memory.
+        :param columns: Number of columns (series) of each row.
+        :param spill: None to drop old rows, True to spill them in a temporary file or a path to spill them in
+            that file.
+        """
+        self.capacity = capacity
+        self.columns = columns
+
+        # Column major, so each column view is contiguous.
+        self.buffer = np.full((columns, 2 * capacity), np.nan)
+        self.start = 0
+        self.size = 0
+
+        # Open spill file.
+        if spill is True:
+            self.spill = tempfile.TemporaryFile()
+        elif spill is not None:
+            self.spill = open(spill, mode='w+b')
+        else:
+            self.spill = None
+        self.spilled = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, column):
+        """Returns a view of the stored values of a column, oldest first."""
+        return self.buffer[column, self.start:self.start + self.size]
+
+    def data(self):
+        """Returns a view of all the stored columns, oldest first. Shape is (columns, rows)."""
+        return self.buffer[:, self.start:self.start + self.size]
+
+    def last(self):
+        """Returns the last row."""
+        return self.buffer[:, self.start + self.size - 1]
+
+    def append(self, *row):
+        """Appends one row, one value per column."""
+        self.extend(np.array(row, dtype=float).reshape(1, self.columns))
+
+    def extend(self, rows):
+        """
+        Appends many rows at once.
+
+        :param rows: Array of shape (rows, columns).
+        """
+        rows = np.asarray(rows, dtype=float).reshape(-1, self.columns)
+
+        # Number of rows pushed out of the buffer, stored ones first.
+        drop = max(self.size + len(rows) - self.capacity, 0)
+        old = min(drop, self.size)
+
+        # Keep them in the spill file.
+        if self.spill is not None and drop:
+            self.spill.seek(0, 2)
+            self.spill.write(self.buffer[:, self.start:self.start + old].T.tobytes())
+            self.spill.write(rows[:drop - old].tobytes())
+            self.spilled += drop
+
+        # Forget them.
+        self.start = (self.start + old) % self.capacity
+        self.size -= old
+        rows = rows[drop - old:]
+
+        # Write the rows up to the end of the first half, then from the beginning.
+        end = (self.start + self.size) % self.capacity
+        first = min(len(rows), self.capacity - end)
+        self.buffer[:, end:end + first] = rows[:first].T
+        self.buffer[:, end + self.capacity:end + self.capacity + first] = rows[:first].T
+        rest = len(rows) - first
+        self.buffer[:, :rest] = rows[first:].T
+        self.buffer[:, self.capacity:self.capacity + rest] = rows[first:].T
+        self.size += len(rows)
+
+    def history(self):
+        """
+        Returns the full history (spilled and stored rows) as a new array of shape (columns, rows).
+        """
+        if self.spill is None or not self.spilled:
+            return self.data().copy()
+        self.spill.flush()
+        self.spill.seek(0)
+        spilled = np.fromfile(self.spill, dtype=float, count=self.spilled * self.columns)
+        return np.concatenate((spilled.reshape(-1, self.columns).T, self.data()), axis=1)
+
+    def clear(self):
+        """Removes all the rows, spilled ones included."""
+        self.start = 0
+        self.size = 0
+        if self.spill is not None:
+            self.spill.seek(0)
+            self.spill.truncate()
+        self.spilled = 0
+
+    def close(self):
+        """Closes the spill file."""
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
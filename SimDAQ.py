@@ -0,0 +1,157 @@
+"""
+Module simulates the cDAQ system and the Peltier stage, to run and benchmark the temperature control without hardware.
+Use SimBackend in place of the NI-MAX tasks: CDAQThread(backend=SimBackend()).
+"""
+import math
+import random
+import time
+
+
+class ThermalPlant:
+    """
+    Second order thermal model of the Peltier stage. The Peltier heats or cools the plate, which loses heat to the
+    ambient (first time constant). The cell follows the plate (second time constant, 0 for a first order model).
+    The RTD measures the cell temperature, with gaussian noise.
+    """
+
+    def __init__(self, ambient=22.0, gain=0.01, tau=300.0, tau_cell=3.0, noise=0.002, temperature=None):
+        """
+        :param ambient: Ambient temperature (°C).
+        :param gain: Heating rate of the plate (°C/s) per % of output.
+        :param tau: Time constant of the plate to ambient losses (s).
+        :param tau_cell: Time constant of the cell following the plate (s). 0 for a first order model.
+        :param noise: Standard deviation of the measurement noise (°C).
+        :param temperature: Initial temperature (°C). Ambient if None.
+        """
+        self.ambient = ambient
+        self.gain = gain
+        self.tau = tau
+        self.tau_cell = tau_cell
+        self.noise = noise
+
+        # Init state.
+        self.plate = ambient if temperature is None else temperature
+        self.cell = self.plate
+
+    def step(self, output, dt):
+        """
+        Advances the model.
+
+        :param output: Peltier output (%), positive to heat.
+        :param dt: Duration (s).
+        """
+        # Integrate with small steps for stability.
+        n = max(int(math.ceil(dt / 0.05)), 1)
+        h = dt / n
+        for _ in range(n):
+            self.plate += h * (self.gain * output - (self.plate - self.ambient) / self.tau)
+            if self.tau_cell:
+                self.cell += h * (self.plate - self.cell) / self.tau_cell
+            else:
+                self.cell = self.plate
+
+    def measure(self):
+        """Returns the measured cell temperature (°C)."""
+        return self.cell + random.gauss(0, self.noise)
+
+
+class SimTask:
+    """
+    Task of the simulated cDAQ, with the methods used by CDAQThread.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.running = False
+
+    def start(self):
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def control(self, action):
+        pass
+
+    def close(self):
+        self.running = False
+
+
+class SimAITask(SimTask):
+    """
+    Analog inputs: RTD of the cell and ambient sensor, in °C.
+    """
+
+    channel_names = ['Sim/RTD', 'Sim/Ambient']
+    units = ['°C', '°C']
+
+    def read(self):
+        # Conversion time of the module.
+        if self.backend.latency:
+            time.sleep(self.backend.latency)
+        plant = self.backend.advance()
+        return [plant.measure(), plant.ambient]
+
+
+class SimCOTask(SimTask):
+    """
+    Counter output generating the Peltier PWM.
+    """
+
+    def write(self, ctr_time):
+        # Duty cycle in %.
+        self.backend.advance()
+        self.backend.duty = 100 * ctr_time.high_time / (ctr_time.high_time + ctr_time.low_time)
+
+
+class SimDOTask(SimTask):
+    """
+    Digital outputs: Peltier direction (True to heat) and enable.
+    """
+
+    def write(self, data):
+        self.backend.advance()
+        self.backend.heat, self.backend.enable = data
+
+
+class SimBackend:
+    """
+    Simulated cDAQ backend for CDAQThread. The plant advances with the real time elapsed between calls (optionally
+    accelerated) and the output written by the tasks.
+    Only software-timed reads are simulated (CDAQThread without rate).
+    """
+
+    def __init__(self, plant=None, speed=1.0, latency=0.0):
+        """
+        :param plant: ThermalPlant simulated. Default model if None.
+        :param speed: Simulated seconds per real second.
+        :param latency: Duration of an analog input read (s).
+        """
+        self.plant = plant or ThermalPlant()
+        self.speed = speed
+        self.latency = latency
+
+        # Init outputs.
+        self.duty = 0.0
+        self.heat = False
+        self.enable = False
+        self.last = time.perf_counter()
+
+    def output(self):
+        """Returns the Peltier output (%) set by the tasks."""
+        if not self.enable:
+            return 0.0
+        return self.duty if self.heat else -self.duty
+
+    def advance(self):
+        """Advances the plant up to now with the current output and returns it."""
+        now = time.perf_counter()
+        self.plant.step(self.output(), (now - self.last) * self.speed)
+        self.last = now
+        return self.plant
+
+    def load(self):
+        return SimAITask(self), SimCOTask(self), SimDOTask(self)
+
+    def read_channels(self, task_ai):
+        return list(task_ai.channel_names), list(task_ai.units)
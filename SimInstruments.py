@@ -0,0 +1,628 @@
+"""
+Module simulates the GPIB instruments and the pump, to run and benchmark the station without hardware.
+Use SimResourceManager in place of pyvisa.ResourceManager() and SimSerialBackend in place of Drivers.SerialBackend(),
+or start the station with --simulate.
+Latencies of the bus and conversion times of the instruments are simulated in real time (time.sleep).
+"""
+import random
+import re
+import threading
+import time
+
+import numpy as np
+
+# VISA status codes of the errors raised (pyvisa.errors.VisaIOError.error_code).
+VI_ERROR_TMO = -1073807339
+VI_ERROR_NENABLED = -1073807257
+
+
+class SimVisaIOError(IOError):
+    """
+    Error of a simulated VISA operation, with its status code as pyvisa.errors.VisaIOError.
+    """
+
+    def __init__(self, error_code, description):
+        super().__init__(description)
+        self.error_code = error_code
+
+
+def scpi_key(header):
+    """
+    Returns the short form of a SCPI command header, without the optional SENS root.
+    Ex: ':SENSE:VOLT:CHAN1:RANGE' -> 'VOLT:CHAN1:RANG'.
+    """
+    key = list()
+    for word in header.strip(':').upper().split(':'):
+        # Keep the numeric suffix (CHAN1).
+        name, suffix = re.match(r'([A-Z*]*)(\d*)', word).groups()
+        # Short form is 4 letters, 3 if the fourth is a vowel.
+        if len(name) > 4:
+            name = name[:3] if name[3] in 'AEIOU' else name[:4]
+        key.append(name + suffix)
+    if key and key[0] == 'SENS':
+        key = key[1:]
+    return ':'.join(key)
+
+
+class SimInstrument:
+    """
+    GPIB instrument of the simulated resource manager, with the methods used by the widgets.
+    """
+
+    # Transfer time of a byte on the bus (s).
+    BYTE_TIME = 1e-6
+
+    def __init__(self, name, latency=0.002):
+        """
+        :param name: VISA resource name.
+        :param latency: Duration of a bus transaction (s).
+        """
+        self.resource_name = name
+        self.latency = latency
+        self.timeout = 2000
+        self.is_open = False
+        self.events_enabled = set()
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def clear(self):
+        pass
+
+    def control_ren(self, mode):
+        pass
+
+    def enable_event(self, event_type, mechanism):
+        self.events_enabled.add(event_type)
+
+    def disable_event(self, event_type, mechanism):
+        self.events_enabled.discard(event_type)
+
+    def discard_events(self, event_type, mechanism):
+        pass
+
+    def status(self):
+        """Returns the status byte."""
+        return 0
+
+    def read_stb(self):
+        """Serial poll."""
+        self.wait(1)
+        return self.status()
+
+    def next_event(self):
+        """Returns the time (perf_counter) of the next change of the status byte, inf if none is expected."""
+        return np.inf
+
+    def wait_on_event(self, event_type, timeout):
+        """
+        Waits for a service request (bit 6 of the status byte).
+
+        :param timeout: Timeout (ms).
+        """
+        if event_type not in self.events_enabled:
+            raise SimVisaIOError(VI_ERROR_NENABLED, 'Specified event type is not enabled for this session.')
+        deadline = time.perf_counter() + timeout / 1000
+        while not self.status() & 64:
+            now = time.perf_counter()
+            if now >= deadline:
+                raise SimVisaIOError(VI_ERROR_TMO, 'Timeout expired before operation completed.')
+            time.sleep(max(min(self.next_event(), deadline) - now, 0) + 1e-6)
+
+    def wait(self, size=0):
+        """Waits for a bus transaction transferring size bytes."""
+        if self.latency:
+            time.sleep(self.latency + size * self.BYTE_TIME)
+
+    def write(self, message):
+        if not self.is_open:
+            raise IOError(0, 'Resource {} is closed'.format(self.resource_name))
+        self.wait(len(message))
+        self.execute(message)
+
+    def read(self):
+        raise IOError(0, 'Timeout expired before operation completed ({})'.format(self.resource_name))
+
+    def read_raw(self):
+        return self.read().encode('latin1')
+
+    def query(self, message):
+        self.write(message)
+        return self.read()
+
+    def query_binary_values(self, message, datatype='f', is_big_endian=False, container=list):
+        """Queries values sent as an IEEE 488.2 definite length block."""
+        self.write(message)
+        data = self.read_raw()
+        start = data.index(b'#')
+        digits = int(data[start + 1:start + 2])
+        length = int(data[start + 2:start + 2 + digits])
+        start += 2 + digits
+        values = np.frombuffer(data[start:start + length], dtype=('>' if is_big_endian else '<') + datatype)
+        return container(values)
+
+    def execute(self, message):
+        pass
+
+
+class SimNanovolt(SimInstrument):
+    """
+    Keithley 2182A nanovoltmeter. The SCPI settings used by DialogNanovolt are kept as written (short form keys),
+    readings are converted continuously at the NPLC rate.
+    The signal is an offset with gaussian noise, plus the voltage of the calibration current if a current source is
+    attached.
+    """
+
+    # Frequency of the power line (Hz).
+    LINE_FREQUENCY = 60
+    # Overhead of a conversion (s).
+    OVERHEAD = 0.002
+    # Reading returned when out of range.
+    OVERFLOW = 9.9e37
+
+    def __init__(self, name, latency=0.002, offset=1e-6, noise=20e-9, source=None, coupling=1e-3):
+        """
+        :param offset: Signal offset (V).
+        :param noise: Standard deviation of the noise (V).
+        :param source: SimCurrentSource of the calibration current. None for no calibration.
+        :param coupling: Voltage per current of the calibration (V/A).
+        """
+        super().__init__(name, latency)
+        self.offset = offset
+        self.noise = noise
+        self.source = source
+        self.coupling = coupling
+
+        # Settings after *RST, and setups saved by *SAV.
+        self.settings = dict()
+        self.reset()
+        self.memory = dict()
+
+        # Init conversions, buffer and measurement event register.
+        self.start = time.perf_counter()
+        self.fetched = -1
+        self.responses = list()
+        self.armed = None
+        self.stored = list()
+        self.available = -1
+        self.events = 0
+        # Measurement event enable register and service request enable register (not changed by *RST).
+        self.events_enable = 0
+        self.service_enable = 0
+
+    def reset(self):
+        self.settings.clear()
+        self.settings.update({'FUNC': '"VOLT:DC"', 'CHAN': '1', 'SYST:LSYN': '0', 'VOLT:NPLC': '5',
+                              'TRAC:POIN': '2', 'TRAC:FEED': 'SENS', 'TRAC:FEED:CONT': 'NEV', 'TRIG:SOUR': 'IMM',
+                              'TRIG:COUN': 'INF', 'SAMP:COUN': '1', 'INIT:CONT': '1', 'FORM:DATA': 'ASC',
+                              'FORM:BORD': 'NORM'})
+        for chan, rang in (('1', '10'), ('2', '10')):
+            self.settings.update({'VOLT:CHAN' + chan + ':RANG': rang,
+                                  'VOLT:CHAN' + chan + ':RANG:AUTO': '1',
+                                  'VOLT:CHAN' + chan + ':LPAS': '1',
+                                  'VOLT:CHAN' + chan + ':DFIL': '1',
+                                  'VOLT:CHAN' + chan + ':DFIL:COUN': '10',
+                                  'VOLT:CHAN' + chan + ':DFIL:TCON': 'MOV'})
+
+    def channel(self, setting):
+        """Returns a setting of the current channel."""
+        return self.settings['VOLT:CHAN' + self.settings['CHAN'] + ':' + setting]
+
+    def period(self):
+        """Returns the time between two readings (s)."""
+        period = float(self.settings['VOLT:NPLC']) / self.LINE_FREQUENCY + self.OVERHEAD
+        # Repeating filter needs COUNT new conversions for each reading.
+        if self.channel('DFIL') == '1' and self.channel('DFIL:TCON') == 'REP':
+            period *= int(self.channel('DFIL:COUN'))
+        return period
+
+    def index(self):
+        """Returns the index of the last completed reading."""
+        return int((time.perf_counter() - self.start) / self.period())
+
+    def reading(self):
+        """Returns a new reading of the signal (V)."""
+        noise = self.noise
+        if self.channel('DFIL') == '1':
+            noise /= int(self.channel('DFIL:COUN')) ** 0.5
+        value = self.offset + random.gauss(0, noise)
+        if self.source is not None:
+            value += self.coupling * self.source.current()
+
+        # Fixed range overflow.
+        if self.channel('RANG:AUTO') != '1' and abs(value) > 1.2 * float(self.channel('RANG')):
+            return self.OVERFLOW
+        return value
+
+    def fresh(self):
+        """Waits for a reading not returned yet and returns it."""
+        index = self.index()
+        if index <= self.fetched:
+            index = self.fetched + 1
+            time.sleep(max(self.start + index * self.period() - time.perf_counter(), 0))
+        self.fetched = index
+        return self.reading()
+
+    def fill(self):
+        """Stores the readings converted since the buffer was armed. Sets the buffer full event when full."""
+        if self.armed is None:
+            return
+        points = int(self.settings['TRAC:POIN'])
+        count = min(int((time.perf_counter() - self.armed) / self.period()), points)
+        self.stored.extend(self.reading() for _ in range(count - len(self.stored)))
+        if len(self.stored) >= points:
+            self.armed = None
+            self.settings['TRAC:FEED:CONT'] = 'NEV'
+            self.events |= 512
+
+    def update(self):
+        """Updates the measurement event register: buffer full (BFL, 512) and reading available (RAV, 32)."""
+        self.fill()
+        index = self.index()
+        if index > self.available:
+            self.available = index
+            self.events |= 32
+
+    def status(self):
+        # Measurement summary bit (0), and request for service (6) if enabled.
+        self.update()
+        summary = 1 if self.events & self.events_enable else 0
+        return summary | (64 if summary & self.service_enable else 0)
+
+    def next_event(self):
+        times = [np.inf]
+        if self.events_enable & 32:
+            times.append(self.start + (self.available + 1) * self.period())
+        if self.events_enable & 512 and self.armed is not None:
+            times.append(self.armed + int(self.settings['TRAC:POIN']) * self.period())
+        return min(times)
+
+    def execute(self, message):
+        # Commands are separated by ';', each starts from the root.
+        for command in message.strip().split(';'):
+            header, _, argument = command.strip().partition(' ')
+            key = scpi_key(header.rstrip('?'))
+            argument = argument.strip()
+            if header.endswith('?'):
+                self.responses.append(self.answer(key))
+            elif key == '*RST':
+                self.reset()
+            elif key == '*SAV':
+                self.memory[int(argument)] = dict(self.settings)
+            elif key == '*RCL':
+                self.settings.update(self.memory.get(int(argument), dict()))
+            elif key == '*CLS':
+                self.update()
+                self.events = 0
+            elif key == '*SRE':
+                self.service_enable = int(argument)
+            elif key == 'STAT:MEAS:ENAB':
+                self.events_enable = int(argument)
+            elif key == 'TRAC:CLE':
+                self.fill()
+                self.stored.clear()
+                self.armed = None
+                self.settings['TRAC:FEED:CONT'] = 'NEV'
+            elif key == 'TRAC:FEED:CONT':
+                self.settings[key] = argument.upper()
+                # Fill the buffer from now.
+                if argument.upper() == 'NEXT':
+                    self.stored.clear()
+                    self.armed = time.perf_counter()
+            elif key == 'FUNC':
+                self.settings[key] = '"VOLT:DC"' if argument.upper() == '"VOLT"' else argument.upper()
+            elif key in self.settings:
+                self.settings[key] = {'ON': '1', 'OFF': '0'}.get(argument.upper(), argument.upper())
+
+    def format(self, values):
+        """
+        Returns readings in the data format: ASCII, or binary block of single (SREAL) or double (DREAL) floats, big
+        endian (NORM) or little endian (SWAP).
+        """
+        data_format = self.settings['FORM:DATA'][:3]
+        if data_format == 'ASC':
+            return ','.join('{:+.9E}'.format(value) for value in values)
+        dtype = ('<' if self.settings['FORM:BORD'][:3] == 'SWA' else '>') + ('f4' if data_format == 'SRE' else 'f8')
+        data = np.array(values, dtype=dtype).tobytes()
+        return '#{}{}'.format(len(str(len(data))), len(data)) + data.decode('latin1')
+
+    def answer(self, key):
+        if key == '*IDN':
+            return 'KEITHLEY INSTRUMENTS INC.,MODEL 2182A,0,SIM'
+        elif key == 'FETC':
+            self.fetched = self.index()
+            return self.format([self.reading()])
+        elif key == 'DATA:FRES':
+            return self.format([self.fresh()])
+        elif key in ('STAT:MEAS', 'STAT:MEAS:EVEN'):
+            # Reading the event register clears it.
+            self.update()
+            events, self.events = self.events, 0
+            return str(events)
+        elif key == 'STAT:MEAS:ENAB':
+            return str(self.events_enable)
+        elif key == '*SRE':
+            return str(self.service_enable)
+        elif key == 'TRAC:DATA':
+            self.fill()
+            return self.format(self.stored)
+        elif key in self.settings:
+            return self.settings[key]
+        return ''
+
+    def read(self):
+        if not self.responses:
+            super().read()
+        # All responses of a message, separated by ';'.
+        response = ';'.join(self.responses)
+        self.responses.clear()
+        self.wait(len(response) + 1)
+        return response + '\n'
+
+
+class SimCurrentSource(SimInstrument):
+    """
+    Keithley 220 current source. Memory locations are programmed with B..L..V..I..W..X, the program is run in
+    single mode (P0) when triggered (T) while operating (F1). Each location outputs its current for its dwell time.
+    """
+
+    def __init__(self, name, latency=0.002):
+        super().__init__(name, latency)
+
+        # Program as {location: (current (A), voltage limit (V), dwell (s))}.
+        self.memory = dict()
+        self.location = 1
+        self.operate = False
+        self.started = None
+
+    def execute(self, message):
+        # Commands are letters followed by a value, executed by X.
+        pending = dict()
+        for letter, value in re.findall(r'([A-Z])([-+0-9.E]*)', message.upper()):
+            if letter != 'X':
+                pending[letter] = float(value) if value else 0.0
+                continue
+
+            # Execute.
+            if 'L' in pending:
+                self.location = int(pending['L'])
+            if 'I' in pending or 'V' in pending or 'W' in pending:
+                current, voltage, dwell = self.memory.get(self.location, (0.0, 0.0, 0.0))
+                self.memory[self.location] = (pending.get('I', current), pending.get('V', voltage),
+                                              pending.get('W', dwell))
+            if 'F' in pending:
+                self.operate = pending['F'] == 1
+                if not self.operate:
+                    self.started = None
+            if 'T' in pending and self.operate:
+                self.started = time.perf_counter()
+            pending.clear()
+
+    def current(self):
+        """Returns the output current (A)."""
+        if not self.operate or self.started is None:
+            return 0.0
+
+        # Location running at this time.
+        elapsed = time.perf_counter() - self.started
+        for location in sorted(self.memory):
+            current, voltage, dwell = self.memory[location]
+            if elapsed < dwell:
+                return current
+            elapsed -= dwell
+        return 0.0
+
+
+class SimResourceManager:
+    """
+    Resource manager of the simulated GPIB bus: a 2182A nanovoltmeter (GPIB0::7) measuring the output of a 220 current
+    source (GPIB0::12).
+    """
+
+    def __init__(self, latency=0.002):
+        """
+        :param latency: Duration of a bus transaction (s).
+        """
+        source = SimCurrentSource('GPIB0::12::INSTR', latency)
+        nvolt = SimNanovolt('GPIB0::7::INSTR', latency, source=source)
+        self.resources = dict((res.resource_name, res) for res in (nvolt, source))
+
+    def list_resources(self, query='?*::INSTR'):
+        return tuple(self.resources)
+
+    def open_resource(self, name):
+        if name not in self.resources:
+            raise IOError(0, 'Resource {} not found'.format(name))
+        resource = self.resources[name]
+        resource.open()
+        return resource
+
+
+class SimPump:
+    """
+    PHD2000 pump on a simulated serial port, with the pyserial methods used by SerialThread. Can be read and written
+    from two threads.
+    Commands end with CR. Each answer is LF, data and CR if any, then LF and the prompt: ':' stopped, '>' infusing or
+    '*' stalled. Bytes are received at the speed of the baudrate (8 data bits, 2 stop bits) after a processing
+    latency. The volume is infused at the set rate until the target is reached.
+    """
+
+    # Units of the rate commands and answers.
+    RATE_COMMANDS = ('MLM', 'ULM', 'MLH', 'ULH')
+    RATE_UNITS = ('ml/mn', 'ul/mn', 'ml/hr', 'ul/hr')
+    # Rate units in ml/s.
+    RATE_SCALES = (1 / 60, 1e-3 / 60, 1 / 3600, 1e-3 / 3600)
+
+    def __init__(self, latency=0.01):
+        """
+        :param latency: Processing time of a command by the pump (s).
+        """
+        self.latency = latency
+
+        # Port settings.
+        self.port = None
+        self.baudrate = 9600
+        self.timeout = None
+        self.is_open = False
+
+        # Pump state.
+        self.diameter = 10.0
+        self.rate = 1.0
+        self.units = 0
+        self.target = 0.0
+        self.delivered = 0.0
+        self.infused = 0.0
+        self.running = False
+        self.stalled = False
+        self.last = time.perf_counter()
+
+        # Received line and bytes sent by the pump, as (time of the first byte, bytes).
+        self.line = bytearray()
+        self.pending = list()
+        self.buffer = bytearray()
+        # Notified when bytes are sent or the port is closed.
+        self.condition = threading.Condition()
+
+    def open(self):
+        self.is_open = True
+        self.last = time.perf_counter()
+
+    def close(self):
+        with self.condition:
+            self.is_open = False
+            self.pending.clear()
+            self.buffer.clear()
+            self.condition.notify_all()
+
+    def char_time(self):
+        """Returns the transmission time of a byte (s)."""
+        return 11 / float(self.baudrate)
+
+    def advance(self, now):
+        """Infuses up to now. Stops when the target is reached."""
+        if self.running and now > self.last:
+            volume = self.rate * self.RATE_SCALES[self.units] * (now - self.last)
+            if self.target and self.infused + volume >= self.target:
+                volume = self.target - self.infused
+                self.running = False
+            self.infused += volume
+            self.delivered += volume
+        self.last = max(self.last, now)
+
+    def prompt(self):
+        if self.stalled:
+            return b'*'
+        return b'>' if self.running else b':'
+
+    def write(self, data):
+        if not self.is_open:
+            raise IOError(0, 'Port not open')
+        now = time.perf_counter()
+        with self.condition:
+            for i, byte in enumerate(data):
+                if byte == 13:
+                    # Command received after its transmission, answered after processing.
+                    done = now + (i + 1) * self.char_time() + self.latency
+                    self.advance(done)
+                    answer = self.execute(bytes(self.line).decode('ascii', 'replace').strip().upper())
+                    self.pending.append((done, answer + b'\n' + self.prompt()))
+                    self.line.clear()
+                else:
+                    self.line.append(byte)
+            self.condition.notify_all()
+        return len(data)
+
+    def execute(self, command):
+        """Executes a command and returns the answer before the prompt."""
+        name, value = command[:3], command[3:]
+        if name == 'RUN':
+            self.running = True
+            self.stalled = False
+            self.infused = 0.0
+        elif name == 'STP':
+            self.running = False
+        elif name == 'CLD':
+            self.delivered = 0.0
+        elif name == 'DIA':
+            return '\n{:.4f}\r'.format(self.diameter).encode('ascii')
+        elif name == 'RAT':
+            return '\n{:8.4f} {}\r'.format(self.rate, self.RATE_UNITS[self.units]).encode('ascii')
+        elif name == 'TAR':
+            return '\n{:.4f}\r'.format(self.target).encode('ascii')
+        elif name == 'DEL':
+            return '\n{:.4f}\r'.format(self.delivered).encode('ascii')
+        elif name == 'VER':
+            return b'\nPHD2000 SIM\r'
+        elif name == 'MMD' and value:
+            self.diameter = float(value)
+        elif name in self.RATE_COMMANDS and value:
+            self.rate = float(value)
+            self.units = self.RATE_COMMANDS.index(name)
+        elif name == 'MLT' and value:
+            self.target = float(value)
+        elif command:
+            return b'\n?\r'
+        return b''
+
+    def receive(self):
+        """Moves the bytes already transmitted to the input buffer."""
+        now = time.perf_counter()
+        while self.pending:
+            start, data = self.pending[0]
+            count = min(max(int((now - start) / self.char_time()), 0), len(data))
+            self.buffer.extend(data[:count])
+            if count < len(data):
+                self.pending[0] = (start + count * self.char_time(), data[count:])
+                break
+            self.pending.pop(0)
+
+    @property
+    def in_waiting(self):
+        with self.condition:
+            self.receive()
+            return len(self.buffer)
+
+    def read(self, size=1):
+        """Waits for size bytes, at most timeout (s) unless None."""
+        deadline = None if self.timeout is None else time.perf_counter() + self.timeout
+        with self.condition:
+            self.receive()
+            while len(self.buffer) < size and self.is_open:
+                now = time.perf_counter()
+                if deadline is not None and now >= deadline:
+                    break
+                # Until the next byte is transmitted, the timeout or a write.
+                wait = self.pending[0][0] + self.char_time() - now if self.pending else None
+                if deadline is not None:
+                    wait = deadline - now if wait is None else min(wait, deadline - now)
+                self.condition.wait(None if wait is None else max(wait, 0))
+                self.receive()
+            data = bytes(self.buffer[:size])
+            del self.buffer[:size]
+        return data
+
+    def reset_input_buffer(self):
+        with self.condition:
+            self.receive()
+            self.buffer.clear()
+
+
+class SimSerialBackend:
+    """
+    Simulated serial backend of the pump, with a single port SIM0 connected to a SimPump.
+    """
+
+    def __init__(self, latency=0.01):
+        """
+        :param latency: Processing time of a command by the pump (s).
+        """
+        self.latency = latency
+
+    def ports(self):
+        return ['SIM0']
+
+    def serial(self):
+        return SimPump(self.latency)
@@ -3,17 +3,21 @@ Module controls cDAQ system and PID.
 Can be executed as standalone or imported to be used as a widget.
 """
 import nidaqmx
+import nidaqmx.stream_readers
 import matplotlib.pyplot as plt
 import numpy as np
 from PyQt5 import QtWidgets, QtCore, QtGui
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
 
+import Clock
+import Perf
 from PID import PID
+from Autotune import RelayTuner
+from RingBuffer import RingBuffer
+from Plot import BlitPlot, RenderScheduler
 from WidgetPID import Ui_WidgetPID
 
-import time
-
 
 class WidgetPID(QtWidgets.QWidget, Ui_WidgetPID):
     """
@@ -21,7 +25,19 @@ class WidgetPID(QtWidgets.QWidget, Ui_WidgetPID):
     cDAQ and update the PID. UI (WidgetPID.ui) made in Qt Designer and converted using pyuic5 command.
     """
 
-    def __init__(self):
+    # Signals to interface thread.
+    s_tune = QtCore.pyqtSignal(bool)
+
+    # Number of updates kept in memory for the graph. Older ones are spilled to disk.
+    CAPACITY = 100000
+
+    def __init__(self, scheduler=None, rate=None, samples=100, backend=None):
+        """
+        :param scheduler: RenderScheduler shared with other widgets. A new one is created if None.
+        :param rate: Sample clock rate (Hz) of the hardware-timed acquisition. None to read on each update.
+        :param samples: Samples per channel read at once by the hardware-timed acquisition.
+        :param backend: cDAQ backend of the worker, see CDAQThread.
+        """
         # Initialise overloaded classes.
         super().__init__()
         self.setupUi(self)
@@ -40,31 +56,43 @@ class WidgetPID(QtWidgets.QWidget, Ui_WidgetPID):
         self.layout_graph.insertWidget(0, self.toolbar)
         self.layout_graph.insertWidget(1, self.canvas)
 
-        # Create empty data lists for graph values.
-        self.data_x = list()
-        self.data_temp = list()
-        self.data_set = list()
-        self.data_pid = list()
+        # Create empty data buffer for graph values. (Time, temperature, set point, output)
+        self.data = RingBuffer(self.CAPACITY, 4, spill=True)
 
         # Add lines.
-        self.line_temp, = self.ax.plot(self.data_x, self.data_temp, c='r', ls='-')
-        self.line_set, = self.ax.plot(self.data_x, self.data_set, c='0.5', ls=':')
-        self.line_pid, = self.ax2.plot(self.data_x, self.data_pid, c='g', ls='-')
+        self.line_temp, = self.ax.plot(self.data[0], self.data[1], c='r', ls='-')
+        self.line_set, = self.ax.plot(self.data[0], self.data[2], c='0.5', ls=':')
+        self.line_pid, = self.ax2.plot(self.data[0], self.data[3], c='g', ls='-')
+
+        # Incremental renderer, run by the scheduler.
+        self.plot = BlitPlot(self.canvas, self.toolbar, [self.line_temp, self.line_set, self.line_pid])
+        self.scheduler = scheduler or RenderScheduler()
+        self.scheduler.add(self, self.rescale)
+
+        # Last values from the cDAQ, shown at next frame.
+        self.names = list()
+        self.values = list()
+        self.units = list()
 
         # Connect slots.
         self.btn_clear.clicked.connect(self.clear_chart)
         self.btn_start.clicked.connect(self.start)
+        self.btn_tune.clicked.connect(self.tune)
 
         # Init status.
         self.label_status.setText('Off')
         self.ico_status.setPixmap(QtGui.QPixmap())
         self.controlling = False
+        self.tuning = False
 
         # Start thread.
         self.thread = QtCore.QThread()
-        self.worker = CDAQThread()
+        self.worker = CDAQThread(rate, samples, backend=backend)
         self.worker.moveToThread(self.thread)
         self.worker.updated.connect(self.updated)
+        self.worker.tuned.connect(self.tuned)
+        self.worker.error.connect(self.task_error)
+        self.s_tune.connect(self.worker.autotune)
         self.worker.finished.connect(self.thread.quit)
         self.destroyed.connect(self.worker.stop)
         self.thread.started.connect(self.worker.start)
@@ -106,61 +134,161 @@ class WidgetPID(QtWidgets.QWidget, Ui_WidgetPID):
             self.controlling = True
             self.worker.toogle_pid(True)
 
-    @QtCore.pyqtSlot(list, list, list)
-    def updated(self, names, values, units):
-        # Update table widget.
-        self.tableWidget.setRowCount(len(names))
-        for i in range(len(names)):
-            self.tableWidget.setItem(i, 0, QtWidgets.QTableWidgetItem(names[i]))
-            self.tableWidget.setItem(i, 1, QtWidgets.QTableWidgetItem('{:0.5f} {}'.format(values[i], units[i])))
+    @QtCore.pyqtSlot()
+    def tune(self):
+        """
+        Starts or cancels the autotuning. The relay experiment drives the output instead of the PID until done.
+        """
+        self.tuning = not self.tuning
+        self.s_tune.emit(self.tuning)
+        self.update_tune_status()
+
+    @QtCore.pyqtSlot(bool, float, float, float)
+    def tuned(self, success, k_p, t_i, t_d):
+        """
+        Slot called when the autotuning is over. Sets the new gains (sent to the worker by the spin boxes).
+        """
+        self.tuning = False
+        self.update_tune_status()
+        if success:
+            self.spin_kc.setValue(k_p)
+            self.spin_ti.setValue(t_i)
+            self.spin_td.setValue(t_d)
+        else:
+            QtWidgets.QMessageBox.warning(self, 'Warning', 'Autotuning timed out, gains unchanged.')
+
+    @QtCore.pyqtSlot(str)
+    def task_error(self, message):
+        # Tasks not started, reloading them may help (ex: after fixing them in NI-MAX).
+        QtWidgets.QMessageBox.critical(self, 'Error', 'cDAQ tasks not started: ' + message)
+
+    def update_tune_status(self):
+        self.btn_tune.setText('Cancel' if self.tuning else 'Autotune')
+        self.btn_start.setEnabled(not self.tuning)
+        if self.tuning:
+            self.label_status.setText('Tuning')
+        else:
+            self.label_status.setText('On' if self.controlling else 'Off')
+
+    @QtCore.pyqtSlot(float, list, list, list)
+    @Perf.timed('pid.updated')
+    def updated(self, timestamp, names, values, units):
+        # Keep values for the table.
+        self.names = names
+        self.values = values
+        self.units = units
 
         # Append values.
-        self.data_x.append(time.time())
-        self.data_temp.append(values[0])
-        self.data_pid.append(values[-1])
-        if self.controlling:
-            self.data_set.append(self.spin_setpoint.value())
-        else:
-            self.data_set.append(np.nan)
+        self.data.append(timestamp, values[0], self.spin_setpoint.value() if self.controlling else np.nan,
+                         values[-1])
 
-        # Update graph.
-        self.line_temp.set_data(self.data_x, self.data_temp)
-        self.line_set.set_data(self.data_x, self.data_set)
-        self.line_pid.set_data(self.data_x, self.data_pid)
-        self.rescale()
+        # Update table and graph at next frame.
+        self.scheduler.request(self)
 
     @QtCore.pyqtSlot()
     def clear_chart(self):
         # Clear all the graph data.
-        self.data_x.clear()
-        self.data_temp.clear()
-        self.data_set.clear()
-        self.data_pid.clear()
+        self.data.clear()
+        self.set_lines()
 
         # Update scale.
-        self.rescale()
+        self.plot.redraw(self.check_autox.isChecked(), self.check_autoy.isChecked())
 
+    def set_lines(self):
+        self.plot.set_data(self.line_temp, self.data[0], self.data[1])
+        self.plot.set_data(self.line_set, self.data[0], self.data[2])
+        self.plot.set_data(self.line_pid, self.data[0], self.data[3])
+
+    @Perf.timed('pid.render')
     def rescale(self):
-        # Update limits.
-        self.ax.relim()
-        # Autoscale axes.
-        self.ax.autoscale(enable=self.check_autox.isChecked(), axis='x')
-        self.ax.autoscale(enable=self.check_autoy.isChecked(), axis='y')
-        self.ax2.autoscale(enable=self.check_autoy.isChecked(), axis='y')
-        # Redraw graph.
-        self.canvas.draw()
-        # Update toolbar home value.
-        self.toolbar.update()
-        self.figure.tight_layout()
+        # Update table widget.
+        self.tableWidget.setRowCount(len(self.names))
+        for i in range(len(self.names)):
+            self.tableWidget.setItem(i, 0, QtWidgets.QTableWidgetItem(self.names[i]))
+            self.tableWidget.setItem(i, 1, QtWidgets.QTableWidgetItem('{:0.5f} {}'.format(self.values[i],
+                                                                                          self.units[i])))
+
+        # Update graph.
+        self.set_lines()
+        # Blit the lines, or redraw graph if the data left the view.
+        self.plot.update(self.check_autox.isChecked(), self.check_autoy.isChecked())
+
+
+class NIBackend:
+    """
+    cDAQ tasks persisted in NI-MAX: TaskTemp (analog inputs), TaskPow (Peltier PWM) and TaskDir (direction, enable).
+    """
+
+    def load(self):
+        """
+        Loads the tasks.
+
+        :return: Tasks as (analog input, counter output, digital output).
+        """
+        return (nidaqmx.system.storage.persisted_task.PersistedTask('TaskTemp').load(),
+                nidaqmx.system.storage.persisted_task.PersistedTask('TaskPow').load(),
+                nidaqmx.system.storage.persisted_task.PersistedTask('TaskDir').load())
+
+    def read_channels(self, task_ai):
+        """
+        Reads the names and the units of the analog input channels.
+        """
+        # Read the names.
+        names = task_ai.channel_names
+
+        # Read the units. (Big and ugly, but it works.)
+        units = ['?'] * len(names)
+        for i in range(len(names)):
+            chan = nidaqmx._task_modules.channels.ai_channel.AIChannel(task_ai._handle, names[i])
+            if chan.ai_meas_type == nidaqmx.constants.UsageTypeAI.TEMPERATURE_RTD and \
+                    chan.ai_temp_units == nidaqmx.constants.TemperatureUnits.DEG_C:
+                units[i] = '°C'
+            elif chan.ai_meas_type == nidaqmx.constants.UsageTypeAI.VOLTAGE:
+                if chan.ai_voltage_units == nidaqmx.constants.VoltageUnits.FROM_CUSTOM_SCALE:
+                    units[i] = chan.ai_custom_scale.scaled_units
+                elif chan.ai_voltage_units == nidaqmx.constants.VoltageUnits.VOLTS:
+                    units[i] = 'V'
+            elif chan.ai_meas_type == nidaqmx.constants.UsageTypeAI.CURRENT and \
+                    chan.ai_current_units == nidaqmx.constants.CurrentUnits.AMPS:
+                units[i] = 'A'
+
+        return names, units
 
 
 class CDAQThread(QtCore.QObject):
     """
     Thread class. Used to read values from the cDAQ system and control the temperature PID.
+    With a rate, the inputs are acquired continuously on the cDAQ sample clock and read by blocks; the PID uses the
+    latest sample and every block is sent for recording.
+    The PID loop runs on its own fixed period timer in this thread, whatever the load of the GUI.
     """
 
     finished = QtCore.pyqtSignal()
-    updated = QtCore.pyqtSignal(list, list, list)
+    # Time of the inputs (Clock), names, values and units of the inputs and output.
+    updated = QtCore.pyqtSignal(float, list, list, list)
+    acquired = QtCore.pyqtSignal(object, object)
+    stats = QtCore.pyqtSignal(int, int)
+    tuned = QtCore.pyqtSignal(bool, float, float, float)
+    # Tasks could not be started. The PID loop idles until they are reloaded.
+    error = QtCore.pyqtSignal(str)
+
+    # Maximum duration of the autotuning (ms).
+    TUNE_TIMEOUT = 2 * 3600 * 1000
+
+    def __init__(self, rate=None, samples=100, period=1000, backend=None):
+        """
+        :param rate: Sample clock rate (Hz). None for software-timed reads, one sample on each update.
+        :param samples: Samples per channel in each block of the hardware-timed acquisition.
+        :param period: Period of the PID loop (ms).
+        :param backend: Object loading the tasks (ex: SimDAQ.SimBackend). NIBackend if None.
+        """
+        # Initialise overloaded classes.
+        super().__init__()
+
+        self.backend = backend or NIBackend()
+        self.rate = rate
+        self.samples = samples
+        self.period = period
 
     @QtCore.pyqtSlot()
     def start(self):
@@ -173,26 +301,61 @@ class CDAQThread(QtCore.QObject):
         self.timer = QtCore.QElapsedTimer()
         self.timer.start()
 
-        # Init PID.
+        # Init PID and autotuner (set while tuning).
         self.pid = PID(timestamp=self.timer.elapsed())
-
-        # Load tasks from NI-MAX.
-        self.task_ai = nidaqmx.system.storage.persisted_task.PersistedTask('TaskTemp').load()
-        self.task_co = nidaqmx.system.storage.persisted_task.PersistedTask('TaskPow').load()
-        self.task_do = nidaqmx.system.storage.persisted_task.PersistedTask('TaskDir').load()
-
-        # Start tasks.
+        self.tuner = None
+
+        # Load and start tasks.
+        self.load_tasks()
+        self.start_tasks()
+
+        # Start PID loop. Single shot timer, armed at each tick for the next deadline.
+        self.ticks = 0
+        self.overruns = 0
+        self.errors = 0
+        self.deadline = self.timer.elapsed()
+        self.loop = QtCore.QTimer(self)
+        self.loop.setTimerType(QtCore.Qt.PreciseTimer)
+        self.loop.setSingleShot(True)
+        self.loop.timeout.connect(self.tick)
+        self.loop.start(0)
+
+    def load_tasks(self):
+        """
+        Loads the tasks from the backend and reads the names and units of the channels once.
+        """
+        self.task_ai, self.task_co, self.task_do = self.backend.load()
+
+        # Channels are constant for a loaded task.
+        self.names, self.units = self.backend.read_channels(self.task_ai)
+
+    def start_tasks(self):
+        # No sample and no update until started.
+        self.latest = None
+        self.started = False
         try:
+            if self.rate:
+                # Continuous acquisition, buffer of 10 blocks.
+                self.task_ai.timing.cfg_samp_clk_timing(self.rate,
+                                                        sample_mode=nidaqmx.constants.AcquisitionType.CONTINUOUS,
+                                                        samps_per_chan=10 * self.samples)
+                # Preallocated block, read every N samples.
+                self.reader = nidaqmx.stream_readers.AnalogMultiChannelReader(self.task_ai.in_stream)
+                self.block = np.zeros((len(self.names), self.samples))
+                self.task_ai.register_every_n_samples_acquired_into_buffer_event(self.samples, self.read_block)
+            # Samples timed by their index from the start of the sample clock, with the task.
+            self.acquired_samples = 0
+            self.t0 = Clock.now()
             self.task_ai.start()
             self.task_do.control(nidaqmx.constants.TaskMode.TASK_RESERVE)
             self.task_co.control(nidaqmx.constants.TaskMode.TASK_RESERVE)
             self.task_do.start()
             self.task_co.start()
+            self.started = True
         except Exception as err:
-            print(err)
+            self.error.emit(str(err))
 
-    @QtCore.pyqtSlot()
-    def stop(self):
+    def stop_tasks(self):
         # Turn off Peltier.
         self.task_do.write([False, False])
 
@@ -203,34 +366,94 @@ class CDAQThread(QtCore.QObject):
         self.task_do.control(nidaqmx.constants.TaskMode.TASK_UNRESERVE)
         self.task_co.control(nidaqmx.constants.TaskMode.TASK_UNRESERVE)
 
-        self.finished.emit()
+        # Release them. (Closing the task also releases the callback.)
+        if self.rate and self.started:
+            self.task_ai.register_every_n_samples_acquired_into_buffer_event(self.samples, None)
+        self.task_ai.close()
+        self.task_co.close()
+        self.task_do.close()
 
     @QtCore.pyqtSlot()
-    def update(self):
-        # Read the names.
-        names = self.task_ai.channel_names
+    def stop(self):
+        self.loop.stop()
+        self.stop_tasks()
+        self.finished.emit()
 
-        # Read the units. (Big and ugly, but it works.)
-        units = ['?'] * len(names)
-        for i in range(len(names)):
-            chan = nidaqmx._task_modules.channels.ai_channel.AIChannel(self.task_ai._handle, names[i])
-            if chan.ai_meas_type == nidaqmx.constants.UsageTypeAI.TEMPERATURE_RTD and \
-                    chan.ai_temp_units == nidaqmx.constants.TemperatureUnits.DEG_C:
-                units[i] = '°C'
-            elif chan.ai_meas_type == nidaqmx.constants.UsageTypeAI.VOLTAGE:
-                if chan.ai_voltage_units == nidaqmx.constants.VoltageUnits.FROM_CUSTOM_SCALE:
-                    units[i] = chan.ai_custom_scale.scaled_units
-                elif chan.ai_voltage_units == nidaqmx.constants.VoltageUnits.VOLTS:
-                    units[i] = 'V'
-            elif chan.ai_meas_type == nidaqmx.constants.UsageTypeAI.CURRENT and \
-                    chan.ai_current_units == nidaqmx.constants.CurrentUnits.AMPS:
-                units[i] = 'A'
+    @QtCore.pyqtSlot()
+    def reload(self):
+        """
+        Reloads the tasks (ex: after they were modified in NI-MAX), channel names and units included.
+        """
+        self.stop_tasks()
+        self.load_tasks()
+        self.start_tasks()
+
+    def read_block(self, task_handle, event_type, samples, callback_data):
+        """
+        Callback of the hardware-timed acquisition, called from a DAQmx thread every N samples.
+        """
+        # Read the block in the preallocated array.
+        self.reader.read_many_sample(self.block, number_of_samples_per_channel=self.samples, timeout=0)
+        # Timestamps from the sample clock: index of the sample since the start.
+        times = self.t0 + (self.acquired_samples + np.arange(self.samples)) / self.rate
+        self.acquired_samples += self.samples
+
+        # Latest sample for the PID, and its time.
+        self.latest = self.block[:, -1].tolist()
+        self.latest_time = times[-1]
+        # Send a copy, the array is reused by the next block.
+        self.acquired.emit(times, self.block.copy())
+        return 0
 
-        # Read the input.
-        values = self.task_ai.read()
+    @QtCore.pyqtSlot()
+    def tick(self):
+        """
+        One period of the PID loop. An error of the period (ex: DAQ timeout) is counted, the loop keeps running.
+        """
+        try:
+            self.update()
+        except Exception as err:
+            print(err)
+            self.errors += 1
+            Perf.gauge('pid.errors', self.errors)
+        self.ticks += 1
+
+        # Next deadline on the period grid, so the timer latency does not accumulate.
+        self.deadline += self.period
+        now = self.timer.elapsed()
+        if now >= self.deadline:
+            # Deadline missed, skip the missed periods and count them.
+            missed = (now - self.deadline) // self.period + 1
+            self.overruns += missed
+            self.deadline += missed * self.period
+        self.loop.start(self.deadline - now)
+
+        # Publish loop statistics.
+        self.stats.emit(self.ticks, self.overruns)
+        Perf.gauge('pid.missed_ticks', self.overruns)
 
-        # Update pid.
-        out = self.pid.update(values[0], self.timer.elapsed()) if self.controlling else 0
+    @QtCore.pyqtSlot()
+    @Perf.timed('pid.update')
+    def update(self):
+        # Read the input, or take the latest sample of the hardware-timed acquisition.
+        if not self.started:
+            return
+        if self.rate:
+            values = self.latest
+            if values is None:
+                return
+            timestamp = self.latest_time
+        else:
+            values = self.task_ai.read()
+            timestamp = Clock.now()
+
+        # Update relay experiment while tuning, pid otherwise.
+        if self.tuner is not None:
+            out = self.tuner.update(values[0], self.timer.elapsed())
+            if self.tuner.done:
+                self.end_tune()
+        else:
+            out = self.pid.update(values[0], self.timer.elapsed()) if self.controlling else 0
 
         # Write the output.
         try:
@@ -250,11 +473,35 @@ class CDAQThread(QtCore.QObject):
             print(err)
 
         # Return inputs and ouputs.
-        self.updated.emit(names + ['Peltier'], values + [out], units + ['%'])
+        self.updated.emit(timestamp, self.names + ['Peltier'], values + [out], self.units + ['%'])
+
+    def end_tune(self):
+        # Push identified gains into the PID. (Ti and Td in ms.)
+        if self.tuner.result is not None:
+            k_p, t_i, t_d = self.tuner.result
+            self.pid.set_kp(k_p)
+            self.pid.set_ti(t_i)
+            self.pid.set_td(t_d)
+            self.tuned.emit(True, k_p, t_i / 1000, t_d / 1000)
+        else:
+            self.tuned.emit(False, 0, 0, 0)
+        self.tuner = None
+        self.pid.clear(self.timer.elapsed())
 
     """
     All the slots to update de PID class.
     """
+    @QtCore.pyqtSlot(bool)
+    def autotune(self, tuning):
+        """
+        Starts or cancels a relay autotuning around the set point, with the maximum output as relay amplitude.
+        """
+        if tuning:
+            self.tuner = RelayTuner(self.pid.SetPoint, self.pid.Guard, timeout=self.TUNE_TIMEOUT)
+        else:
+            self.tuner = None
+            self.pid.clear(self.timer.elapsed())
+
     @QtCore.pyqtSlot(bool)
     def toogle_pid(self, controlling):
         self.controlling = controlling
@@ -283,26 +530,26 @@ class CDAQThread(QtCore.QObject):
     def set_max(self, maximum):
         self.pid.set_guard(maximum)
 
+    @QtCore.pyqtSlot(int)
+    def set_period(self, period):
+        # Period in ms, used from the next tick.
+        self.period = period
+
 
 if __name__ == "__main__":
     import sys
+    from Drivers import daq_backend
 
     # Define app.
     app = QtWidgets.QApplication(sys.argv)
 
-    # Create pid widget.
-    wid = WidgetPID()
+    # Create pid widget. Simulated cDAQ and Peltier stage with --simulate.
+    wid = WidgetPID(backend=daq_backend('--simulate' in sys.argv))
 
     # Show window.
     wid.show()
     wid.setWindowTitle('Temperature control')
     wid.setMinimumSize(wid.minimumSizeHint())
 
-    # Create timer.
-    timer = QtCore.QTimer()
-    timer.setInterval(1000)
-    timer.timeout.connect(wid.worker.update)
-    timer.start()
-
     # Run GUI loop.
     sys.exit(app.exec_())
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+# Form implementation generated from reading ui file 'WidgetDiagnostics.ui'
+#
+# Created by: PyQt5 UI code generator 5.8.2
+#
+# WARNING! All changes made in this file will be lost!
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+
+class Ui_WidgetDiagnostics(object):
+    def setupUi(self, WidgetDiagnostics):
+        WidgetDiagnostics.setObjectName("WidgetDiagnostics")
+        WidgetDiagnostics.resize(640, 560)
+        self.gridLayout = QtWidgets.QGridLayout(WidgetDiagnostics)
+        self.gridLayout.setObjectName("gridLayout")
+        self.table_stages = QtWidgets.QTableWidget(WidgetDiagnostics)
+        self.table_stages.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.table_stages.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.table_stages.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.table_stages.setObjectName("table_stages")
+        self.table_stages.setColumnCount(5)
+        self.table_stages.setRowCount(0)
+        item = QtWidgets.QTableWidgetItem()
+        self.table_stages.setHorizontalHeaderItem(0, item)
+        item = QtWidgets.QTableWidgetItem()
+        self.table_stages.setHorizontalHeaderItem(1, item)
+        item = QtWidgets.QTableWidgetItem()
+        self.table_stages.setHorizontalHeaderItem(2, item)
+        item = QtWidgets.QTableWidgetItem()
+        self.table_stages.setHorizontalHeaderItem(3, item)
+        item = QtWidgets.QTableWidgetItem()
+        self.table_stages.setHorizontalHeaderItem(4, item)
+        self.table_stages.horizontalHeader().setStretchLastSection(True)
+        self.table_stages.verticalHeader().setVisible(False)
+        self.gridLayout.addWidget(self.table_stages, 0, 0, 1, 3)
+        self.table_gauges = QtWidgets.QTableWidget(WidgetDiagnostics)
+        self.table_gauges.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.table_gauges.setObjectName("table_gauges")
+        self.table_gauges.setColumnCount(2)
+        self.table_gauges.setRowCount(0)
+        item = QtWidgets.QTableWidgetItem()
+        self.table_gauges.setHorizontalHeaderItem(0, item)
+        item = QtWidgets.QTableWidgetItem()
+        self.table_gauges.setHorizontalHeaderItem(1, item)
+        self.table_gauges.horizontalHeader().setStretchLastSection(True)
+        self.table_gauges.verticalHeader().setVisible(False)
+        self.gridLayout.addWidget(self.table_gauges, 0, 3, 1, 1)
+        self.layout_graph = QtWidgets.QVBoxLayout()
+        self.layout_graph.setObjectName("layout_graph")
+        self.gridLayout.addLayout(self.layout_graph, 1, 0, 1, 4)
+        self.check_log = QtWidgets.QCheckBox(WidgetDiagnostics)
+        self.check_log.setObjectName("check_log")
+        self.gridLayout.addWidget(self.check_log, 2, 0, 1, 1)
+        self.line_log = QtWidgets.QLineEdit(WidgetDiagnostics)
+        self.line_log.setObjectName("line_log")
+        self.gridLayout.addWidget(self.line_log, 2, 1, 1, 2)
+        self.btn_browse = QtWidgets.QPushButton(WidgetDiagnostics)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Fixed)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.btn_browse.sizePolicy().hasHeightForWidth())
+        self.btn_browse.setSizePolicy(sizePolicy)
+        self.btn_browse.setObjectName("btn_browse")
+        self.gridLayout.addWidget(self.btn_browse, 2, 3, 1, 1)
+
+        self.retranslateUi(WidgetDiagnostics)
+        QtCore.QMetaObject.connectSlotsByName(WidgetDiagnostics)
+
+    def retranslateUi(self, WidgetDiagnostics):
+        _translate = QtCore.QCoreApplication.translate
+        WidgetDiagnostics.setWindowTitle(_translate("WidgetDiagnostics", "Diagnostics"))
+        item = self.table_stages.horizontalHeaderItem(0)
+        item.setText(_translate("WidgetDiagnostics", "Stage"))
+        item = self.table_stages.horizontalHeaderItem(1)
+        item.setText(_translate("WidgetDiagnostics", "Calls/s"))
+        item = self.table_stages.horizontalHeaderItem(2)
+        item.setText(_translate("WidgetDiagnostics", "p50 (ms)"))
+        item = self.table_stages.horizontalHeaderItem(3)
+        item.setText(_translate("WidgetDiagnostics", "p99 (ms)"))
+        item = self.table_stages.horizontalHeaderItem(4)
+        item.setText(_translate("WidgetDiagnostics", "Max (ms)"))
+        item = self.table_gauges.horizontalHeaderItem(0)
+        item.setText(_translate("WidgetDiagnostics", "Gauge"))
+        item = self.table_gauges.horizontalHeaderItem(1)
+        item.setText(_translate("WidgetDiagnostics", "Value"))
+        self.check_log.setText(_translate("WidgetDiagnostics", "Log to file"))
+        self.btn_browse.setText(_translate("WidgetDiagnostics", "Browse"))
+
+
+if __name__ == "__main__":
+    import sys
+    app = QtWidgets.QApplication(sys.argv)
+    WidgetDiagnostics = QtWidgets.QWidget()
+    ui = Ui_WidgetDiagnostics()
+    ui.setupUi(WidgetDiagnostics)
+    WidgetDiagnostics.show()
+    sys.exit(app.exec_())
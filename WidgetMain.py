@@ -165,7 +165,7 @@ class Ui_Form(object):
         self.group_nvolt.setTitle(_translate("Form", "nVoltmeter"))
         self.group_cSource.setTitle(_translate("Form", "Current Source"))
         self.groupBox.setTitle(_translate("Form", "Acquisition"))
-        self.label.setText(_translate("Form", "Interval"))
+        self.label.setText(_translate("Form", "PID period"))
         self.spin_interval.setSuffix(_translate("Form", " ms"))
         self.label_12.setText(_translate("Form", "Path"))
         self.edit_path.setPlaceholderText(_translate("Form", "File path"))
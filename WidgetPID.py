@@ -94,7 +94,7 @@ class Ui_WidgetPID(object):
         self._line_1.setFrameShape(QtWidgets.QFrame.VLine)
         self._line_1.setFrameShadow(QtWidgets.QFrame.Sunken)
         self._line_1.setObjectName("_line_1")
-        self.gridLayout.addWidget(self._line_1, 0, 1, 5, 1)
+        self.gridLayout.addWidget(self._line_1, 0, 1, 6, 1)
         self.layout_graph = QtWidgets.QVBoxLayout()
         self.layout_graph.setObjectName("layout_graph")
         self.horizontalLayout = QtWidgets.QHBoxLayout()
@@ -118,10 +118,13 @@ class Ui_WidgetPID(object):
         spacerItem = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
         self.horizontalLayout.addItem(spacerItem)
         self.layout_graph.addLayout(self.horizontalLayout)
-        self.gridLayout.addLayout(self.layout_graph, 0, 0, 5, 1)
+        self.gridLayout.addLayout(self.layout_graph, 0, 0, 6, 1)
         self.btn_start = QtWidgets.QPushButton(WidgetPID)
         self.btn_start.setObjectName("btn_start")
         self.gridLayout.addWidget(self.btn_start, 4, 2, 1, 1)
+        self.btn_tune = QtWidgets.QPushButton(WidgetPID)
+        self.btn_tune.setObjectName("btn_tune")
+        self.gridLayout.addWidget(self.btn_tune, 5, 2, 1, 1)
         self._line_3 = QtWidgets.QFrame(WidgetPID)
         self._line_3.setFrameShape(QtWidgets.QFrame.HLine)
         self._line_3.setFrameShadow(QtWidgets.QFrame.Sunken)
@@ -165,6 +168,7 @@ class Ui_WidgetPID(object):
         self.check_autox.setText(_translate("WidgetPID", "Autoscale X"))
         self.check_autoy.setText(_translate("WidgetPID", "Autoscale Y"))
         self.btn_start.setText(_translate("WidgetPID", "Start"))
+        self.btn_tune.setText(_translate("WidgetPID", "Autotune"))
         item = self.tableWidget.horizontalHeaderItem(0)
         item.setText(_translate("WidgetPID", "Name"))
         item = self.tableWidget.horizontalHeaderItem(1)
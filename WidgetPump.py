@@ -84,6 +84,9 @@ class Ui_WidgetPump(object):
         self.btn_infuse = QtWidgets.QPushButton(WidgetPump)
         self.btn_infuse.setObjectName("btn_infuse")
         self.gridLayout.addWidget(self.btn_infuse, 7, 0, 1, 2)
+        self.btn_schedule = QtWidgets.QPushButton(WidgetPump)
+        self.btn_schedule.setObjectName("btn_schedule")
+        self.gridLayout.addWidget(self.btn_schedule, 8, 0, 1, 2)
         self.ico_state = QtWidgets.QLabel(WidgetPump)
         self.ico_state.setMinimumSize(QtCore.QSize(32, 32))
         self.ico_state.setObjectName("ico_state")
@@ -102,6 +105,7 @@ class Ui_WidgetPump(object):
         WidgetPump.setTabOrder(self.combo_baud, self.btn_conn)
         WidgetPump.setTabOrder(self.btn_conn, self.btn_config)
         WidgetPump.setTabOrder(self.btn_config, self.btn_infuse)
+        WidgetPump.setTabOrder(self.btn_infuse, self.btn_schedule)
 
     def retranslateUi(self, WidgetPump):
         _translate = QtCore.QCoreApplication.translate
@@ -118,4 +122,6 @@ class Ui_WidgetPump(object):
         self._label_3.setText(_translate("WidgetPump", "Target:"))
         self.lbl_target.setText(_translate("WidgetPump", "NA"))
         self.btn_infuse.setText(_translate("WidgetPump", "Infuse"))
+        self.btn_schedule.setToolTip(_translate("WidgetPump", "Run the injections of a schedule file: one injection per line as volume (µl), rate (µl/min), delay before the injection (s)."))
+        self.btn_schedule.setText(_translate("WidgetPump", "Run schedule..."))
 
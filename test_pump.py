@@ -0,0 +1,116 @@
+"""
+Tests of the parsing of the answers of the PHD2000, on recorded byte streams fed in chunks of random sizes.
+Run with: python -m pytest test_pump.py
+"""
+import random
+import unittest
+
+from Pump import AnswerParser, SerialThread, decode_answer
+
+# Recorded streams: (kind of the command answered, for decode_answer) and bytes of its answer.
+SESSION = [
+    (SerialThread.NONE, b'\n:'),                      # Status request, stopped.
+    (SerialThread.DIAMETER, b'\n14.5700\r\n:'),
+    (SerialThread.RATE, b'\n120.000 ul/mn\r\n:'),
+    (SerialThread.TARGET, b'\n0.00200\r\n:'),
+    (SerialThread.NONE, b'\n:'),                      # MLT.
+    (SerialThread.NONE, b'\n>'),                      # RUN, infusing.
+    (SerialThread.DELIVERED, b'\n0.00051\r\n>'),
+    (SerialThread.NONE, b'\n>'),
+    (SerialThread.DELIVERED, b'\n0.00200\r\n:'),      # Target reached.
+    (SerialThread.RATE, b'\n2.50000 ml/hr\r\n:'),
+    (SerialThread.NONE, b'\n?\r\n:'),                 # Unknown command.
+    (SerialThread.NONE, b'\nOOR\r\n:'),               # Out of range.
+    (SerialThread.NONE, b'\n>'),
+    (SerialThread.NONE, b'\n*'),                      # Stalled.
+    (SerialThread.NONE, b'\n:'),
+]
+# Line noise at the connection of the port, and between answers.
+NOISE = [b'\x00', b'\xff\xfe', b'~', b'\x00\x00\x00']
+
+
+def chunks(stream, rng):
+    """Splits a stream in chunks of 1 to 8 bytes."""
+    i = 0
+    while i < len(stream):
+        size = rng.randint(1, 8)
+        yield stream[i:i + size]
+        i += size
+
+
+def decoded(kinds, answers):
+    """Returns the states of the answers, with the values decoded, or the errors raised, for their commands."""
+    values = list()
+    for kind, answer in zip(kinds, answers):
+        try:
+            value = decode_answer(kind, answer.data) if kind != SerialThread.NONE else answer.data
+        except ValueError as err:
+            value = type(err)
+        values.append((answer.state, value))
+    return values
+
+
+class TestAnswerParser(unittest.TestCase):
+
+    def setUp(self):
+        self.kinds = [kind for kind, _ in SESSION]
+        self.stream = b''.join(data for _, data in SESSION)
+        self.whole = AnswerParser().feed(self.stream)
+
+    def test_whole_stream(self):
+        self.assertEqual(len(self.whole), len(SESSION))
+        self.assertEqual([answer.state for answer in self.whole[5:9]], [SerialThread.FORWARD] * 3 +
+                         [SerialThread.STOPPED])
+        self.assertEqual(self.whole[13].state, SerialThread.STALLED)
+        values = decoded(self.kinds, self.whole)
+        self.assertEqual(values[1][1], 14.57)
+        self.assertEqual(values[2][1], (120.0, 1))
+        self.assertEqual(values[9][1], (2.5, 2))
+        self.assertEqual(values[10][1], b'?')
+
+    def test_random_chunks(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            parser = AnswerParser()
+            answers = list()
+            for chunk in chunks(self.stream, rng):
+                answers.extend(parser.feed(chunk))
+            self.assertEqual(answers, self.whole)
+            self.assertEqual(decoded(self.kinds, answers), decoded(self.kinds, self.whole))
+            self.assertEqual(parser.buffer, b'')
+
+    def test_noise(self):
+        rng = random.Random(1)
+        for _ in range(200):
+            # Noise before the answers, skipped.
+            stream = b''.join(rng.choice(NOISE) + data for _, data in SESSION)
+            parser = AnswerParser()
+            answers = list()
+            for chunk in chunks(stream, rng):
+                answers.extend(parser.feed(chunk))
+            self.assertEqual(answers, self.whole)
+
+    def test_partial_answer(self):
+        parser = AnswerParser()
+        self.assertEqual(parser.feed(b'\n14.57'), [])
+        self.assertEqual(parser.feed(b'00\r\n'), [])
+        answers = parser.feed(b':\n>')
+        self.assertEqual([answer.state for answer in answers], [SerialThread.STOPPED, SerialThread.FORWARD])
+        self.assertEqual(decode_answer(SerialThread.DIAMETER, answers[0].data), 14.57)
+
+    def test_clear(self):
+        # Partial answer dropped, as when a command is sent again.
+        parser = AnswerParser()
+        parser.feed(b'\n0.0005')
+        parser.clear()
+        self.assertEqual(parser.feed(b'\n0.00200\r\n:'), AnswerParser().feed(b'\n0.00200\r\n:'))
+
+    def test_decode_errors(self):
+        for kind, data in ((SerialThread.DIAMETER, None), (SerialThread.DIAMETER, b'?'),
+                           (SerialThread.RATE, b'OOR'), (SerialThread.RATE, b'1.0 l/s')):
+            with self.assertRaises(ValueError):
+                decode_answer(kind, data)
+
+
+if __name__ == '__main__':
+    unittest.main()